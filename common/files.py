@@ -0,0 +1,29 @@
+"""
+File helpers shared by the data pipeline and the model loading: content digests
+to tell real changes from touched files, and the check for the optional Parquet engine.
+"""
+import hashlib
+
+
+def file_digest(path: str) -> str:
+    """
+    :return: The sha256 hex digest of the file content, read in 1 MiB blocks.
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def has_pyarrow() -> bool:
+    """
+    :return: Whether `pyarrow` is installed, so data can be cached as Parquet.
+    :rtype: bool
+    """
+    try:
+        import pyarrow
+    except ImportError:
+        return False
+    return True
@@ -0,0 +1,112 @@
+"""
+Process-lifetime registry for pickled models and vectorizers.
+Each artifact is unpickled once and reused until the file on disk changes: the
+mtime and size are checked on every lookup and, when they differ, the content
+hash decides whether the artifact really has to be reloaded. A new artifact
+dropped in place is therefore picked up by a long-running process without a restart.
+"""
+import os
+import threading
+import joblib
+from common.files import file_digest
+
+MODEL_MMAP_MODE = os.getenv("MODEL_MMAP_MODE") or None
+
+
+class _Artifact:
+    def __init__(self, obj, stamp, digest):
+        self.obj = obj
+        self.stamp = stamp
+        self.digest = digest
+        self.derived = {}
+
+
+class ModelRegistry:
+    def __init__(self, mmap_mode: str = MODEL_MMAP_MODE):
+        """
+        :param mmap_mode: Passed to `joblib.load`. With e.g. "r", large NumPy arrays in
+            artifacts saved by `joblib.dump` are memory-mapped instead of read into memory.
+            Plain pickles are loaded as usual.
+        :type mmap_mode: str
+        """
+        self.mmap_mode = mmap_mode
+        self._artifacts = {}
+        self._lock = threading.Lock()
+
+    def _load(self, path: str):
+        if path.endswith(".npz"):
+            from common.compiled_forest import CompiledForest
+
+            return CompiledForest.load(path)
+        return joblib.load(path, mmap_mode=self.mmap_mode)
+
+    def get(self, path: str):
+        """
+        Returns the artifact stored at `path`, loading it only if it is not cached yet
+        or the file has changed since it was loaded.
+
+        :param path: Path to the pickled artifact, or to a forest compiled by
+            `common.compiled_forest` (`.npz`).
+        :type path: str
+        :return: The unpickled object.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            artifact = self._artifacts.get(path)
+            if artifact is not None and artifact.stamp == stamp:
+                return artifact.obj
+
+            digest = file_digest(path)
+            if artifact is not None and artifact.digest == digest:
+                artifact.stamp = stamp
+                return artifact.obj
+
+            obj = self._load(path)
+            self._artifacts[path] = _Artifact(obj, stamp, digest)
+            return obj
+
+    def derived(self, path: str, name: str, build):
+        """
+        Returns a value computed from the artifact at `path`, such as its input columns.
+        The value is built once per loaded artifact and rebuilt after a reload.
+
+        :param path: Path to the pickled artifact.
+        :type path: str
+        :param name: Name of the derived value.
+        :type name: str
+        :param build: Callable that takes the artifact and returns the value.
+        :return: The derived value.
+        """
+        obj = self.get(path)
+        with self._lock:
+            artifact = self._artifacts[os.path.abspath(path)]
+            if artifact.obj is not obj:
+                return build(obj)
+            if name not in artifact.derived:
+                artifact.derived[name] = build(obj)
+            return artifact.derived[name]
+
+    def digest(self, path: str) -> str:
+        """
+        :param path: Path to the pickled artifact.
+        :type path: str
+        :return: The SHA-256 of the file the current artifact was loaded from.
+        :rtype: str
+        """
+        obj = self.get(path)
+        with self._lock:
+            artifact = self._artifacts[os.path.abspath(path)]
+            return artifact.digest if artifact.obj is obj else file_digest(path)
+
+    def clear(self) -> None:
+        """
+        Forgets every loaded artifact.
+        """
+        with self._lock:
+            self._artifacts.clear()
+
+
+registry = ModelRegistry()
@@ -0,0 +1,113 @@
+"""
+Shared MongoDB access for the pipeline, the API and the bot.
+Every entry point gets its client from this module, so each process keeps a single
+connection pool per URI instead of paying for connection setup and server discovery
+on every call. The pool is configured through environment variables (or the `.env` file).
+"""
+import os
+import threading
+import pymongo
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+MONGO_DATABASE = os.getenv("MONGO_DATABASE", "PythonForDs")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000"))
+
+_clients = {}
+_owner_pid = os.getpid()
+_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    # MongoClient is not fork-safe: a forked worker (e.g. uwsgi) must open its own pool.
+    global _owner_pid
+    if os.getpid() != _owner_pid:
+        _clients.clear()
+        _owner_pid = os.getpid()
+
+
+def get_client(uri: str = None) -> pymongo.MongoClient:
+    """
+    Returns the process-wide MongoClient for the given URI, creating it on first use.
+
+    :param uri: MongoDB connection string. Defaults to `MONGO_URI`.
+    :type uri: str
+    :return: A shared MongoClient with the configured pool size and timeouts.
+    :rtype: pymongo.MongoClient
+    """
+    uri = uri or MONGO_URI
+    with _lock:
+        _reset_after_fork()
+        client = _clients.get(uri)
+        if client is None:
+            client = pymongo.MongoClient(
+                uri,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                connect=False
+            )
+            _clients[uri] = client
+        return client
+
+
+def set_client(client, uri: str = None) -> None:
+    """
+    Registers an already created client (for example a mongomock client in tests)
+    as the shared client for the given URI.
+
+    :param client: The client instance to share.
+    :param uri: MongoDB connection string. Defaults to `MONGO_URI`.
+    :type uri: str
+    """
+    with _lock:
+        _reset_after_fork()
+        _clients[uri or MONGO_URI] = client
+
+
+def get_database(name: str = None, uri: str = None):
+    """
+    Returns a database handle from the shared client.
+
+    :param name: Database name. Defaults to `MONGO_DATABASE`.
+    :type name: str
+    :param uri: MongoDB connection string. Defaults to `MONGO_URI`.
+    :type uri: str
+    :return: The requested database.
+    :rtype: pymongo.database.Database
+    """
+    return get_client(uri)[name or MONGO_DATABASE]
+
+
+def get_collection(name: str, database: str = None, uri: str = None):
+    """
+    Returns a collection handle from the shared client.
+
+    :param name: Collection name.
+    :type name: str
+    :param database: Database name. Defaults to `MONGO_DATABASE`.
+    :type database: str
+    :param uri: MongoDB connection string. Defaults to `MONGO_URI`.
+    :type uri: str
+    :return: The requested collection.
+    :rtype: pymongo.collection.Collection
+    """
+    return get_database(database, uri)[name]
+
+
+def close_clients() -> None:
+    """
+    Closes every shared client. The next call to `get_client` opens a new pool.
+    """
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -0,0 +1,93 @@
+"""
+In-process cache for serialized /predict responses.
+Predictions change only when main.py writes a new batch, so every write bumps a
+generation counter stored in MongoDB and the cache drops its entries when it sees
+a new generation. The counter itself is read at most once per check interval,
+which keeps hot requests free of database round trips.
+"""
+import os
+import threading
+import time
+import pymongo
+from common.mongo import get_collection
+
+PREDICTION_CACHE_CHECK_SECONDS = float(os.getenv("PREDICTION_CACHE_CHECK_SECONDS", "10"))
+META_COLLECTION = "meta"
+GENERATION_ID = "prediction_generation"
+
+
+def bump_generation() -> int:
+    """
+    Marks the stored predictions as changed so that every cache drops its entries.
+
+    :return: The new generation number.
+    :rtype: int
+    """
+    doc = get_collection(META_COLLECTION).find_one_and_update(
+        {"_id": GENERATION_ID},
+        {"$inc": {"generation": 1}},
+        upsert=True,
+        return_document=pymongo.ReturnDocument.AFTER
+    )
+    return doc["generation"]
+
+
+def read_generation() -> int:
+    """
+    Reads the current prediction generation.
+
+    :return: The generation number, 0 if no batch has been written yet.
+    :rtype: int
+    """
+    doc = get_collection(META_COLLECTION).find_one({"_id": GENERATION_ID})
+    return doc["generation"] if doc else 0
+
+
+class PredictionCache:
+    def __init__(self, check_interval: float = PREDICTION_CACHE_CHECK_SECONDS, load_generation=read_generation):
+        self.check_interval = check_interval
+        self.load_generation = load_generation
+        self._entries = {}
+        self._generation = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def _sync(self) -> int:
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.check_interval:
+            generation = self.load_generation()
+            if generation != self._generation:
+                self._entries.clear()
+                self._generation = generation
+            self._checked_at = now
+        return self._generation
+
+    def get_or_build(self, key, build):
+        """
+        Returns the cached value for `key`, building it with `build()` on a miss.
+        A `None` result is returned but not cached, and a value built while a new
+        generation arrived is not stored.
+
+        :param key: Hashable cache key.
+        :param build: Callable producing the value.
+        :return: The cached or freshly built value.
+        """
+        with self._lock:
+            generation = self._sync()
+            if key in self._entries:
+                return self._entries[key]
+
+        value = build()
+        if value is not None:
+            with self._lock:
+                if self._generation == generation:
+                    self._entries[key] = value
+        return value
+
+    def invalidate(self) -> None:
+        """
+        Drops all entries and forces the generation to be re-read on the next lookup.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._checked_at = None
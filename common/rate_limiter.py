@@ -0,0 +1,59 @@
+"""
+Asynchronous rate limiter for outgoing API calls such as Telegram messages.
+Calls are spaced evenly at `rate` per second and at most `max_concurrency` of them
+run at the same time, so a fan-out to many chats stays within the API limits
+without sending the messages one after another.
+"""
+import asyncio
+
+
+class AsyncRateLimiter:
+    def __init__(self, rate: float, max_concurrency: int = None):
+        """
+        :param rate: Maximum number of calls started per second.
+        :type rate: float
+        :param max_concurrency: Maximum number of calls in flight, unlimited when None.
+        :type max_concurrency: int
+        """
+        self.interval = 1.0 / rate
+        self.max_concurrency = max_concurrency
+        self._next_slot = 0.0
+        self._lock = None
+        self._semaphore = None
+
+    def _primitives(self):
+        # Created lazily so that the limiter can be built outside of a running event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            if self.max_concurrency:
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._lock, self._semaphore
+
+    async def acquire(self) -> None:
+        """
+        Waits for the next free slot.
+        """
+        lock, semaphore = self._primitives()
+        if semaphore is not None:
+            await semaphore.acquire()
+        try:
+            async with lock:
+                now = asyncio.get_running_loop().time()
+                slot = max(now, self._next_slot)
+                self._next_slot = slot + self.interval
+            if slot > now:
+                await asyncio.sleep(slot - now)
+        except BaseException:
+            self.release()
+            raise
+
+    def release(self) -> None:
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
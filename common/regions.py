@@ -0,0 +1,59 @@
+"""
+Registry of the Ukrainian regions from `data/regions.csv`.
+The file is read once at import and every lookup is a dict access, so the API, the
+bot and the weather collector share one mapping between Ukrainian region names,
+regional centers, alternative names and region ids.
+"""
+import csv
+import os
+from typing import NamedTuple
+
+REGIONS_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "regions.csv")
+# Regions without weather forecasts and predictions
+EXCLUDED_FROM_PREDICTIONS = frozenset({"АР Крим", "Луганська"})
+
+
+class Region(NamedTuple):
+    name: str
+    center_city_ua: str
+    center_city_en: str
+    alt_name: str
+    id: int
+
+
+def load_regions(path: str = REGIONS_CSV) -> tuple:
+    """
+    Reads the regions in file order.
+
+    :param path: Path to the regions CSV file.
+    :type path: str
+    :return: A tuple of `Region`.
+    :rtype: tuple
+    """
+    with open(path, encoding="utf-8", newline="") as f:
+        return tuple(
+            Region(row["region"], row["center_city_ua"], row["center_city_en"], row["region_alt"], int(row["region_id"]))
+            for row in csv.DictReader(f)
+        )
+
+
+REGIONS = load_regions()
+BY_NAME = {region.name: region for region in REGIONS}
+BY_CITY_EN = {region.center_city_en: region for region in REGIONS}
+BY_ALT_NAME = {region.alt_name: region for region in REGIONS}
+BY_ID = {region.id: region for region in REGIONS}
+PREDICTED_REGIONS = tuple(region for region in REGIONS if region.name not in EXCLUDED_FROM_PREDICTIONS)
+
+
+def region_by_city_en(city: str) -> Region:
+    """
+    :param city: English name of a regional center, e.g. "Lviv".
+    :type city: str
+    :raises KeyError: If no region has this center.
+    :return: The region.
+    :rtype: Region
+    """
+    try:
+        return BY_CITY_EN[city]
+    except KeyError:
+        raise KeyError(f"Unknown region center: {city}")
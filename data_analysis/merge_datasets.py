@@ -0,0 +1,311 @@
+"""
+Builds the final training dataset from the prepared weather, alarms and ISW data,
+the scripted counterpart of `merge_datasets.ipynb`.
+The prepared CSVs are streamed once into monthly staging files and every month is
+joined on its own: alarms are attached to region-hours with a left join, one row per
+alarm like the notebook, and the ISW features with a sorted join on the hour. Each month is written as its own
+partition (`month=YYYY-MM`), so new data only rebuilds the months it touches instead
+of re-joining the whole history.
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+import pandas as pd
+from common.files import file_digest, has_pyarrow
+from common.regions import REGIONS
+
+PREPARED_DIR = "prepared_data"
+STAGING_DIR = "prepared_data/merge_staging"
+OUTPUT_DIR = "prepared_data/final_dataset"
+CHUNK_ROWS = 100_000
+# Source name -> (prepared CSV, time column used for partitioning)
+SOURCES = {
+    "weather": ("weather_prepared.csv", "datetime"),
+    "alarms": ("alarms_prepared.csv", "hour_time"),
+    "isw": ("isw_prepared.csv", "hour_time"),
+}
+ALARM_COLUMNS = ["alarms_start_epoch", "alarms_end_epoch"]
+# Staged alarm columns and their types, for months without alarms
+ALARM_DTYPES = {"region_city": object, "hour_time": object, "all_region": "int64",
+                "start_epoch": "float64", "end_epoch": "float64"}
+REGIONS_BY_CITY_UA = {region.center_city_ua: region.name for region in REGIONS}
+
+
+def _source_stamp(path: str) -> list:
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def stage_source(csv_path: str, time_column: str, staging_dir: str, chunk_rows: int = CHUNK_ROWS) -> dict:
+    """
+    Streams a prepared CSV in chunks and splits its rows into one CSV per month.
+
+    :param csv_path: The prepared CSV.
+    :type csv_path: str
+    :param time_column: Column with the hour of every row.
+    :type time_column: str
+    :param staging_dir: Directory for the monthly files, replaced by this call.
+    :type staging_dir: str
+    :param chunk_rows: Rows read at once.
+    :type chunk_rows: int
+    :return: The content digest of every monthly file, by month.
+    :rtype: dict
+    """
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+        chunk = chunk.drop(columns=["Unnamed: 0"], errors="ignore")
+        months = pd.to_datetime(chunk[time_column]).dt.strftime("%Y-%m")
+        for month, rows in chunk.groupby(months, sort=False):
+            path = os.path.join(staging_dir, f"{month}.csv")
+            rows.to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+
+    return {
+        name[:-len(".csv")]: file_digest(os.path.join(staging_dir, name))
+        for name in sorted(os.listdir(staging_dir))
+    }
+
+
+def stage_sources(prepared_dir: str = PREPARED_DIR, staging_dir: str = STAGING_DIR,
+                  chunk_rows: int = CHUNK_ROWS) -> set:
+    """
+    Re-stages the sources whose CSV changed since the last run.
+
+    :return: The months whose staged data changed in any source.
+    :rtype: set
+    """
+    manifest_path = os.path.join(staging_dir, "manifest.json")
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    changed = set()
+    for name, (file_name, time_column) in SOURCES.items():
+        csv_path = os.path.join(prepared_dir, file_name)
+        stamp = _source_stamp(csv_path)
+        previous = manifest.get(name, {})
+        if previous.get("stamp") == stamp:
+            continue
+
+        months = stage_source(csv_path, time_column, os.path.join(staging_dir, name), chunk_rows)
+        old_months = previous.get("months", {})
+        changed |= {month for month in months.keys() | old_months.keys() if months.get(month) != old_months.get(month)}
+        manifest[name] = {"stamp": stamp, "months": months}
+
+    os.makedirs(staging_dir, exist_ok=True)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    return changed
+
+
+def staged_months(staging_dir: str = STAGING_DIR) -> list:
+    weather_dir = os.path.join(staging_dir, "weather")
+    return sorted(name[:-len(".csv")] for name in os.listdir(weather_dir) if name.endswith(".csv"))
+
+
+def read_staged(staging_dir: str, source: str, month: str) -> pd.DataFrame:
+    path = os.path.join(staging_dir, source, f"{month}.csv")
+    return pd.read_csv(path) if os.path.exists(path) else None
+
+
+def prepare_alarms(alarms: pd.DataFrame) -> pd.DataFrame:
+    alarms = alarms.add_prefix("alarms_")
+    alarms["alarms_hour_time"] = pd.to_datetime(alarms["alarms_hour_time"])
+    return alarms.sort_values(["alarms_hour_time", "alarms_region_city"], kind="stable")
+
+
+def next_alarm(staging_dir: str, month: str):
+    """
+    :return: The alarm columns of the first alarm after `month`, used to back-fill the
+        end of the month like a back-fill over the whole history would, or None.
+    """
+    later = [name for name in sorted(os.listdir(os.path.join(staging_dir, "alarms"))) if name[:-len(".csv")] > month]
+    for name in later:
+        alarms = prepare_alarms(pd.read_csv(os.path.join(staging_dir, "alarms", name)))
+        if len(alarms):
+            return alarms[ALARM_COLUMNS].iloc[0]
+    return None
+
+
+def backfilled_months(staging_dir: str, available: list, changed: set) -> set:
+    """
+    Finds the months whose end is back-filled from a changed month: walking back from
+    every changed month, each earlier month up to and including the last one with
+    alarms of its own takes its trailing alarm columns from the next alarm.
+
+    :param staging_dir: Directory of the monthly staging files.
+    :type staging_dir: str
+    :param available: The staged months, sorted.
+    :type available: list
+    :param changed: Months whose staged data changed.
+    :type changed: set
+    :return: The months that have to be rebuilt with the changed ones.
+    :rtype: set
+    """
+    dependents = set()
+    for month in changed:
+        for earlier in reversed([m for m in available if m < month]):
+            if earlier in dependents:
+                break
+            dependents.add(earlier)
+            if os.path.exists(os.path.join(staging_dir, "alarms", f"{earlier}.csv")):
+                break
+    return dependents
+
+
+def merge_month(weather: pd.DataFrame, alarms: pd.DataFrame = None, isw: pd.DataFrame = None,
+                following_alarm: pd.Series = None) -> pd.DataFrame:
+    """
+    Joins one month of weather, alarms and ISW data the way `merge_datasets.ipynb` does.
+
+    :param weather: Weather rows with a `city` (Ukrainian regional center) and `datetime` column.
+    :param alarms: Alarm rows expanded to hours (`region_city`, `hour_time`, `all_region`,
+        `start_epoch`, `end_epoch`), or None.
+    :param isw: ISW features by `hour_time`, or None.
+    :param following_alarm: Alarm columns used for the rows after the last alarm of the month.
+    :return: The merged month, ordered by hour and region.
+    :rtype: pandas.DataFrame
+    """
+    weather = weather.drop(columns=["Unnamed: 0"], errors="ignore")
+    weather["datetime"] = pd.to_datetime(weather["datetime"])
+    weather["region"] = weather.pop("city").map(REGIONS_BY_CITY_UA)
+    weather = weather[weather["region"].notna()].sort_values(["datetime", "region"], kind="stable")
+
+    if alarms is None:
+        # Numeric alarm columns, so the back-fill below does not downcast an object column
+        alarms = pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in ALARM_DTYPES.items()})
+    alarms = prepare_alarms(alarms)
+    alarms["alarms_region_city"] = alarms["alarms_region_city"].astype(object)
+    # A region-hour with overlapping alarms gets one row per alarm, e.g. a Київська hour
+    # with an alarm of the whole region and one of the city gives a "Київ" row as well
+    df = weather.merge(alarms, how="left", left_on=["region", "datetime"],
+                       right_on=["alarms_region_city", "alarms_hour_time"])
+
+    df.loc[(df["region"] == "Київська") & (df["alarms_all_region"] == 0), "region"] = "Київ"
+    df = df.drop(["alarms_hour_time", "alarms_region_city", "alarms_all_region"], axis=1)
+    df = df.sort_values(["datetime", "region"], kind="stable", ignore_index=True)
+
+    df["is_alarm"] = df["alarms_start_epoch"].notna().astype(int)
+    df[ALARM_COLUMNS] = df[ALARM_COLUMNS].bfill()
+    if following_alarm is not None:
+        df[ALARM_COLUMNS] = df[ALARM_COLUMNS].fillna(following_alarm)
+
+    if isw is not None and len(isw):
+        isw = isw.drop(columns=["Unnamed: 0"], errors="ignore")
+        isw["hour_time"] = pd.to_datetime(isw["hour_time"])
+        isw = isw.drop_duplicates("hour_time", keep="last").sort_values("hour_time")
+        df = pd.merge_asof(df, isw, left_on="datetime", right_on="hour_time", tolerance=pd.Timedelta(0))
+        df = df.drop(["hour_time"], axis=1)
+
+    df = df.drop(["datetime"], axis=1)
+    return df.fillna(0)
+
+
+def _partition_dir(output_dir: str, month: str) -> str:
+    return os.path.join(output_dir, f"month={month}")
+
+
+def write_partition(df: pd.DataFrame, output_dir: str, month: str) -> str:
+    """
+    Replaces the partition of a month. Parquet is used when pyarrow is installed,
+    a pandas pickle otherwise.
+
+    :return: The written file.
+    :rtype: str
+    """
+    partition = _partition_dir(output_dir, month)
+    tmp_partition = partition + ".tmp"
+    shutil.rmtree(tmp_partition, ignore_errors=True)
+    os.makedirs(tmp_partition)
+    if has_pyarrow():
+        path = os.path.join(tmp_partition, "part-0.parquet")
+        df.to_parquet(path, index=False)
+    else:
+        path = os.path.join(tmp_partition, "part-0.pkl")
+        df.to_pickle(path)
+
+    shutil.rmtree(partition, ignore_errors=True)
+    os.replace(tmp_partition, partition)
+    return os.path.join(partition, os.path.basename(path))
+
+
+def read_final_dataset(output_dir: str = OUTPUT_DIR, months: list = None) -> pd.DataFrame:
+    """
+    Reads the partitioned final dataset in month order.
+
+    :param output_dir: Directory with the `month=YYYY-MM` partitions.
+    :type output_dir: str
+    :param months: Months to read, all when None.
+    :type months: list
+    :rtype: pandas.DataFrame
+    """
+    parts = []
+    for name in sorted(os.listdir(output_dir)):
+        if not name.startswith("month=") or name.endswith(".tmp"):
+            continue
+        if months is not None and name[len("month="):] not in months:
+            continue
+        for file_name in sorted(os.listdir(os.path.join(output_dir, name))):
+            path = os.path.join(output_dir, name, file_name)
+            parts.append(pd.read_parquet(path) if file_name.endswith(".parquet") else pd.read_pickle(path))
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+
+def build(prepared_dir: str = PREPARED_DIR, staging_dir: str = STAGING_DIR, output_dir: str = OUTPUT_DIR,
+          months: list = None, rebuild: bool = False, chunk_rows: int = CHUNK_ROWS) -> list:
+    """
+    Stages the sources and (re)builds the partitions of the months that need it: months
+    whose staged data changed, months without a partition, the requested months, or
+    every month with `rebuild`. A changed month also rebuilds the months before it
+    down to the last one with alarms, since their last rows are back-filled from the
+    next alarm.
+
+    :return: The rebuilt months.
+    :rtype: list
+    """
+    changed = stage_sources(prepared_dir, staging_dir, chunk_rows)
+    available = staged_months(staging_dir)
+
+    if rebuild:
+        selected = set(available)
+    else:
+        selected = {month for month in available if not os.path.isdir(_partition_dir(output_dir, month))}
+        selected |= changed | set(months or [])
+        selected |= backfilled_months(staging_dir, available, changed)
+    selected = sorted(selected & set(available))
+
+    for month in selected:
+        df = merge_month(
+            read_staged(staging_dir, "weather", month),
+            read_staged(staging_dir, "alarms", month),
+            read_staged(staging_dir, "isw", month),
+            next_alarm(staging_dir, month)
+        )
+        write_partition(df, output_dir, month)
+    return selected
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge the prepared data into the partitioned final dataset")
+    parser.add_argument("--prepared-dir", default=PREPARED_DIR, help="Directory with the prepared CSV files")
+    parser.add_argument("--staging-dir", default=STAGING_DIR, help="Directory for the monthly staging files")
+    parser.add_argument("--output", default=OUTPUT_DIR, help="Output directory of the partitioned dataset")
+    parser.add_argument("--month", action="append", dest="months", help="Month (YYYY-MM) to rebuild, repeatable")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild every month")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Rows read from a CSV at once")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    try:
+        months = build(args.prepared_dir, args.staging_dir, args.output, args.months, args.rebuild, args.chunk_rows)
+        print(f"Rebuilt {len(months)} month(s) in {time.perf_counter() - started:.1f}s: {', '.join(months) or 'none'}")
+    except Exception as e:
+        print(f"Merge error: {str(e)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -43,10 +43,27 @@ sudo apt-get install -y mongodb-mongosh
 docker pull mongodb/mongodb-community-server:latest
 docker run --name mongodb -p 27017:27017 -d mongodb/mongodb-community-server:latest
 
-# Set up cron job for regular predictions
-sudo apt install -y cron
-sudo systemctl enable cron
-(crontab -l 2>/dev/null; echo "0 * * * * cd $HOME/war-prediction && $HOME/war-prediction/.venv/bin/python main.py") | crontab -
+# Run the resident prediction scheduler (a cycle every hour) as a systemd service,
+# started now and on boot and restarted whenever it exits; logs: journalctl -u war-prediction
+sudo tee /etc/systemd/system/war-prediction.service > /dev/null <<UNIT
+[Unit]
+Description=War Event Prediction scheduler
+After=network-online.target docker.service
+Wants=network-online.target
+StartLimitIntervalSec=0
+
+[Service]
+User=$USER
+WorkingDirectory=$HOME/war-prediction
+ExecStart=$HOME/war-prediction/.venv/bin/python main.py
+Restart=always
+RestartSec=30
+
+[Install]
+WantedBy=multi-user.target
+UNIT
+sudo systemctl daemon-reload
+sudo systemctl enable --now war-prediction
 
 # Create project directory
 cd /home/ubuntu
@@ -0,0 +1,217 @@
+"""
+History of air alarms per region.
+The active alerts API only returns a snapshot of the regions under alarm, so the
+recorder polls it and turns consecutive snapshots into one interval document per
+alarm (region, start, end). `AlarmIndex` loads the intervals into sorted NumPy
+arrays and answers "was region R under alarm during hour H" with a binary search,
+or labels millions of region-hours at once with a single vectorized search.
+All times are UTC.
+"""
+import argparse
+from bisect import bisect_right
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import pymongo
+from apscheduler.schedulers.blocking import BlockingScheduler
+from common.mongo import get_collection
+from get_data.alerts.get_active_alerts import get_provider
+
+ALARM_HISTORY_COLLECTION = "alarm_history"
+POLL_SECONDS = 60
+HOUR = 3600
+# Region codes are packed above the epoch seconds into one sortable int64 key
+_TIME_BITS = 34
+
+
+def _epoch(value) -> int:
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize("UTC")
+    return int(timestamp.timestamp())
+
+
+def _epochs(values) -> np.ndarray:
+    times = pd.to_datetime(pd.Series(values), utc=True)
+    return times.dt.tz_localize(None).to_numpy(dtype="datetime64[s]").astype(np.int64)
+
+
+class AlarmHistoryRecorder:
+    def __init__(self, collection=None):
+        self.collection = collection if collection is not None else get_collection(ALARM_HISTORY_COLLECTION)
+        self._open = None
+
+    def _load_open(self) -> set:
+        if self._open is None:
+            self.collection.create_index([("region", pymongo.ASCENDING), ("start", pymongo.ASCENDING)])
+            self.collection.create_index([("end", pymongo.ASCENDING)])
+            self._open = {doc["region"] for doc in self.collection.find({"end": None}, {"_id": 0, "region": 1})}
+        return self._open
+
+    def record(self, active_regions, at: datetime = None) -> tuple:
+        """
+        Records a snapshot of the regions under alarm: an interval is opened for every
+        region that became active and closed for every region that is no longer active.
+        A snapshot equal to the previous one costs no database access.
+
+        :param active_regions: Regions with an active alarm.
+        :param at: Time of the snapshot, defaults to now.
+        :type at: datetime.datetime
+        :return: The sorted started and ended regions.
+        :rtype: tuple
+        """
+        at = at or datetime.now(timezone.utc)
+        active = set(active_regions)
+        open_regions = self._load_open()
+        started = sorted(active - open_regions)
+        ended = sorted(open_regions - active)
+
+        if started:
+            self.collection.insert_many([{"region": region, "start": at, "end": None} for region in started])
+        if ended:
+            self.collection.update_many({"region": {"$in": ended}, "end": None}, {"$set": {"end": at}})
+        self._open = active
+        return started, ended
+
+    def poll(self) -> None:
+        """
+        Fetches the active alerts through the shared provider and records them.
+        """
+        try:
+            self.record(get_provider().get())
+        except Exception as e:
+            print(f"Failed to record alarms: {str(e)}")
+
+
+class AlarmIndex:
+    def __init__(self, intervals, now: datetime = None):
+        """
+        :param intervals: Iterable of (region, start, end) with `end` None for an alarm
+            that is still active. Overlapping intervals of a region are merged.
+        :param now: End used for active alarms, defaults to now.
+        :type now: datetime.datetime
+        """
+        df = pd.DataFrame(list(intervals), columns=["region", "start", "end"])
+        df["end"] = df["end"].fillna(pd.Timestamp(now or datetime.now(timezone.utc)))
+        for column in ("start", "end"):
+            df[column] = _epochs(df[column])
+
+        self.regions = sorted(df["region"].unique())
+        self.codes = {region: code for code, region in enumerate(self.regions)}
+        df["code"] = df["region"].map(self.codes).astype(np.int64)
+        df = df.sort_values(["code", "start"], kind="stable", ignore_index=True)
+
+        # Merge overlapping intervals: a new interval starts when the region changes or
+        # the start is after every end seen so far in the region
+        reach = df.groupby("code")["end"].cummax()
+        new_interval = (df["code"] != df["code"].shift()) | (df["start"] > reach.shift())
+        merged = df.groupby(new_interval.cumsum()).agg(code=("code", "first"), start=("start", "min"),
+                                                        end=("end", "max"))
+
+        self._codes = merged["code"].to_numpy(dtype=np.int64)
+        self._starts = merged["start"].to_numpy(dtype=np.int64)
+        self._ends = merged["end"].to_numpy(dtype=np.int64)
+        self._keys = (self._codes << _TIME_BITS) + self._starts
+        bounds = np.searchsorted(self._codes, np.arange(len(self.regions) + 1))
+        self.starts = {region: self._starts[bounds[c]:bounds[c + 1]] for c, region in enumerate(self.regions)}
+        self.ends = {region: self._ends[bounds[c]:bounds[c + 1]] for c, region in enumerate(self.regions)}
+
+    @classmethod
+    def from_collection(cls, collection=None, start: datetime = None, end: datetime = None, now: datetime = None):
+        """
+        Loads the recorded intervals that overlap [start, end).
+        """
+        collection = collection if collection is not None else get_collection(ALARM_HISTORY_COLLECTION)
+        query = {}
+        if end is not None:
+            query["start"] = {"$lt": end}
+        if start is not None:
+            query["$or"] = [{"end": None}, {"end": {"$gt": start}}]
+        docs = collection.find(query, {"_id": 0, "region": 1, "start": 1, "end": 1})
+        return cls(((doc["region"], doc["start"], doc["end"]) for doc in docs), now=now)
+
+    def is_active(self, region: str, hour) -> bool:
+        """
+        :param region: Region name.
+        :type region: str
+        :param hour: Start of the hour.
+        :return: True if the region was under alarm at any time during the hour.
+        :rtype: bool
+        """
+        starts = self.starts.get(region)
+        if starts is None:
+            return False
+        hour_start = _epoch(hour)
+        i = bisect_right(starts, hour_start + HOUR - 1) - 1
+        return i >= 0 and self.ends[region][i] > hour_start
+
+    def label(self, regions, hours) -> pd.DataFrame:
+        """
+        Labels region-hours with the alarm that overlaps them, in one vectorized search.
+
+        :param regions: Region name of every row.
+        :param hours: Start of the hour of every row (datetimes, UTC).
+        :return: A DataFrame with `is_alarm`, `alarms_start_epoch` and `alarms_end_epoch`
+            (NaN when there was no alarm), aligned with the input rows.
+        :rtype: pandas.DataFrame
+        """
+        regions = pd.Series(regions, dtype=object).to_numpy()
+        hour_starts = _epochs(hours)
+
+        codes = pd.Series(regions).map(self.codes).to_numpy(dtype=float)
+        known = ~np.isnan(codes)
+        codes = np.where(known, codes, 0).astype(np.int64)
+
+        # The last interval of the region that starts before the end of the hour
+        keys = (codes << _TIME_BITS) + hour_starts + HOUR - 1
+        i = np.searchsorted(self._keys, keys, side="right") - 1
+        valid = known & (i >= 0)
+        i = np.where(valid, i, 0)
+        if len(self._keys):
+            valid &= (self._keys[i] >> _TIME_BITS) == codes
+            valid &= self._ends[i] > hour_starts
+            starts, ends = self._starts[i], self._ends[i]
+        else:
+            starts = ends = np.zeros(len(i), dtype=np.int64)
+
+        return pd.DataFrame({
+            "is_alarm": valid.astype(int),
+            "alarms_start_epoch": np.where(valid, starts, np.nan),
+            "alarms_end_epoch": np.where(valid, ends, np.nan),
+        })
+
+    def label_range(self, start: datetime, end: datetime, regions: list = None) -> pd.DataFrame:
+        """
+        Labels every region-hour in [start, end).
+
+        :param regions: Regions to label, the regions with recorded alarms when None.
+        :type regions: list
+        :return: A DataFrame with `region`, `hour` and the columns of `label`.
+        :rtype: pandas.DataFrame
+        """
+        regions = list(self.regions if regions is None else regions)
+        hours = pd.date_range(pd.Timestamp(start).floor("h"), end, freq="1h", inclusive="left")
+        grid = pd.DataFrame({
+            "region": np.repeat(np.array(regions, dtype=object), len(hours)),
+            "hour": np.tile(hours.to_numpy(), len(regions)),
+        })
+        return pd.concat([grid, self.label(grid["region"], grid["hour"])], axis=1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record the history of air alarms")
+    parser.add_argument("--interval", type=int, default=POLL_SECONDS, help="Seconds between polls")
+    args = parser.parse_args(argv)
+
+    recorder = AlarmHistoryRecorder()
+    scheduler = BlockingScheduler()
+    scheduler.add_job(recorder.poll, "interval", seconds=args.interval, next_run_time=datetime.now(),
+                      max_instances=1, coalesce=True)
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+
+
+if __name__ == "__main__":
+    main()
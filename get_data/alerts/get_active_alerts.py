@@ -1,7 +1,20 @@
+"""
+Active air alerts from the alerts.in.ua API.
+Every process shares one `AlertsProvider`: it keeps a single API client, caches the
+alert list for a short TTL and lets concurrent callers share one upstream request,
+so `/alarms` and the bot are served from memory most of the time.
+"""
 import os
+import threading
+import time
+from concurrent.futures import Future
 from dotenv import load_dotenv
 from alerts_in_ua import Client as AlertsClient
 
+load_dotenv()
+
+ALERTS_CACHE_TTL = float(os.getenv("ALERTS_CACHE_TTL", "15"))
+
 
 def load_api_token() -> str:
     load_dotenv()
@@ -13,9 +26,9 @@ def load_api_token() -> str:
     return token
 
 
-def fetch_active_alerts(token: str):
+def fetch_active_alerts(token: str = None, client: AlertsClient = None):
     try:
-        alerts_client = AlertsClient(token=token)
+        alerts_client = client or AlertsClient(token=token)
         active_alerts = alerts_client.get_active_alerts()
 
         return [getattr(alert, "location_title", "Unknown").replace(" область", "") for alert in active_alerts]
@@ -25,11 +38,90 @@ def fetch_active_alerts(token: str):
         raise RuntimeError(f"Error getting alerts data: {str(e)}")
 
 
+class AlertsProvider:
+    def __init__(self, fetch=None, ttl: float = ALERTS_CACHE_TTL):
+        """
+        :param fetch: Callable returning the list of regions with an active alert.
+            Defaults to the alerts.in.ua API through a reused client.
+        :param ttl: Seconds a fetched list is served from memory.
+        :type ttl: float
+        """
+        self._fetch = fetch or self._fetch_from_api
+        self.ttl = ttl
+        self._client = None
+        self._alerts = None
+        self._fetched_at = None
+        self._in_flight = None
+        self._lock = threading.Lock()
+
+    def _fetch_from_api(self) -> list:
+        if self._client is None:
+            self._client = AlertsClient(token=load_api_token())
+        return fetch_active_alerts(client=self._client)
+
+    def get(self) -> list:
+        """
+        Returns the regions with an active alert. A cached list younger than the TTL is
+        returned as is; otherwise one caller fetches a new list and concurrent callers
+        wait for its result instead of calling the API themselves.
+
+        :raises EnvironmentError: If the API token is missing.
+        :raises RuntimeError: If the API request fails.
+        :return: A list of region names.
+        :rtype: list
+        """
+        with self._lock:
+            if self._fetched_at is not None and time.monotonic() - self._fetched_at < self.ttl:
+                return self._alerts
+            future = self._in_flight
+            leader = future is None
+            if leader:
+                future = self._in_flight = Future()
+
+        if not leader:
+            return future.result()
+
+        try:
+            alerts = self._fetch()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            with self._lock:
+                self._alerts = alerts
+                self._fetched_at = time.monotonic()
+            future.set_result(alerts)
+            return alerts
+        finally:
+            with self._lock:
+                self._in_flight = None
+
+    def invalidate(self) -> None:
+        """
+        Drops the cached list, the next call fetches a new one.
+        """
+        with self._lock:
+            self._fetched_at = None
+
+
+_provider = AlertsProvider()
+
+
+def get_provider() -> AlertsProvider:
+    return _provider
+
+
+def set_provider(provider: AlertsProvider) -> None:
+    """
+    Replaces the process-wide provider, e.g. with a stub in tests.
+    """
+    global _provider
+    _provider = provider
+
+
 def main():
     try:
-        token = load_api_token()
-        alerts = fetch_active_alerts(token)
-        return alerts
+        return get_provider().get()
 
     except (EnvironmentError, RuntimeError) as e:
         print(str(e))
@@ -0,0 +1,84 @@
+"""
+Backfills the ISW feature store with TF-IDF features of every processed report.
+Reports are streamed from the `isw_report` collection in date order and vectorized in
+chunks with the saved vectorizer; only reports newer than the last stored date are
+processed unless a rebuild is requested.
+"""
+import argparse
+import time
+from itertools import islice
+from common.mongo import get_client, MONGO_URI, MONGO_DATABASE
+from common.model_registry import registry
+from get_data.isw.feature_store import IswFeatureStore, FEATURE_STORE_DIR
+from get_data.isw.last_isw import TextNormalizer, VECTORIZER_PATH
+
+CHUNK_SIZE = 200
+
+
+def backfill(collection, store: IswFeatureStore, vectorizer, chunk_size: int = CHUNK_SIZE,
+             rebuild: bool = False) -> int:
+    """
+    Vectorizes the reports that are not in the store yet and appends them chunk by chunk.
+
+    :param collection: MongoDB collection with `date` and `extracted_text` fields.
+    :param store: The feature store to update.
+    :type store: IswFeatureStore
+    :param vectorizer: A fitted TF-IDF vectorizer.
+    :param chunk_size: Number of reports normalized and vectorized at once.
+    :type chunk_size: int
+    :param rebuild: Drop the store and vectorize every report again.
+    :type rebuild: bool
+    :return: The number of appended reports.
+    :rtype: int
+    """
+    if rebuild:
+        store.clear()
+    last_date = store.last_date()
+    query = {"date": {"$gt": last_date}} if last_date else {}
+    cursor = collection.find(query, {"_id": 0, "date": 1, "extracted_text": 1}).sort("date", 1)
+
+    normalizer = TextNormalizer()
+    feature_names = vectorizer.get_feature_names_out()
+    appended = 0
+    seen = set()
+    while chunk := list(islice(cursor, chunk_size)):
+        # a date can be stored more than once, only its first report is used
+        chunk = [doc for doc in chunk if doc["date"] not in seen and not seen.add(doc["date"])]
+        if not chunk:
+            continue
+        # every chunk is appended as soon as it is vectorized, only one chunk is kept in memory
+        matrix = vectorizer.transform(normalizer.normalize_many(doc["extracted_text"] for doc in chunk))
+        appended += store.append([doc["date"] for doc in chunk], matrix, feature_names)
+    return appended
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ISW TF-IDF feature backfill")
+    parser.add_argument("--mongo", default=MONGO_URI,
+                        help="MongoDB connection string (default: MONGO_URI or localhost)")
+    parser.add_argument("--database", default=MONGO_DATABASE,
+                        help="MongoDB database name (default: PythonForDs)")
+    parser.add_argument("--collection", default="isw_report",
+                        help="MongoDB collection with processed reports (default: isw_report)")
+    parser.add_argument("--vectorizer", default=VECTORIZER_PATH,
+                        help=f"Path to the fitted TF-IDF vectorizer (default: {VECTORIZER_PATH})")
+    parser.add_argument("--output", default=FEATURE_STORE_DIR,
+                        help=f"Feature store directory (default: {FEATURE_STORE_DIR})")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help=f"Number of reports vectorized at once (default: {CHUNK_SIZE})")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Vectorize every report again instead of appending new ones")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    try:
+        collection = get_client(args.mongo)[args.database][args.collection]
+        appended = backfill(collection, IswFeatureStore(args.output), registry.get(args.vectorizer),
+                            args.chunk_size, args.rebuild)
+        print(f"Appended {appended} reports in {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        print(f"Error occurred: {e}")
+
+
+if __name__ == "__main__":
+    main()
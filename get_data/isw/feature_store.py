@@ -0,0 +1,160 @@
+"""
+On-disk store for TF-IDF features of the ISW reports.
+The features are kept as a sparse CSR matrix with one row per report date, split into
+parts: every append writes its rows as a new part (data, indices and indptr .npy files)
+and replaces a small index with the sorted dates and the first row of every part.
+Appending a day costs as much as the day itself, every part can be memory-mapped and
+a single row is read from its part without loading the whole matrix.
+"""
+import os
+import shutil
+from typing import Optional
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+FEATURE_STORE_DIR = "prepared_data/isw_features"
+INDEX_FILE = "index.npz"
+FEATURE_NAMES_FILE = "feature_names.npy"
+PART_ARRAYS = ("data", "indices", "indptr")
+
+
+class IswFeatureStore:
+    def __init__(self, path: str = FEATURE_STORE_DIR):
+        self.path = path
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _part(self, part: int, name: str) -> str:
+        return self._file(f"part-{part:05d}-{name}.npy")
+
+    def clear(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def exists(self) -> bool:
+        return os.path.exists(self._file(INDEX_FILE)) and os.path.exists(self._file(FEATURE_NAMES_FILE))
+
+    def _index(self) -> tuple:
+        """
+        :return: The sorted dates and the first row of every part followed by the row count.
+        :rtype: tuple
+        """
+        with np.load(self._file(INDEX_FILE), allow_pickle=False) as index:
+            return index["dates"], index["offsets"]
+
+    def _load_part(self, part: int, mmap: bool = True) -> tuple:
+        return tuple(np.load(self._part(part, name), mmap_mode="r" if mmap else None, allow_pickle=False)
+                     for name in PART_ARRAYS)
+
+    def dates(self) -> np.ndarray:
+        """
+        :return: The sorted report dates as `datetime64[D]`, empty if the store does not exist.
+        :rtype: numpy.ndarray
+        """
+        if not self.exists():
+            return np.array([], dtype="datetime64[D]")
+        return self._index()[0]
+
+    def feature_names(self) -> np.ndarray:
+        return np.load(self._file(FEATURE_NAMES_FILE), allow_pickle=False)
+
+    def last_date(self):
+        """
+        :return: The most recent stored report date, or None for an empty store.
+        """
+        dates = self.dates()
+        return pd.Timestamp(dates[-1]).to_pydatetime() if len(dates) else None
+
+    def load(self, mmap: bool = True):
+        """
+        Loads the whole store.
+
+        :param mmap: Memory-map the part arrays instead of reading them into memory. A store
+            with a single part is returned without copying, several parts are stacked.
+        :type mmap: bool
+        :return: A tuple of the CSR matrix, the dates and the feature names.
+        :rtype: tuple
+        """
+        dates, offsets = self._index()
+        names = self.feature_names()
+        parts = [
+            sparse.csr_matrix(self._load_part(part, mmap), shape=(int(end - start), len(names)), copy=False)
+            for part, (start, end) in enumerate(zip(offsets[:-1], offsets[1:]))
+        ]
+        if len(parts) == 1:
+            matrix = parts[0]
+        elif parts:
+            matrix = sparse.vstack(parts, format="csr")
+        else:
+            matrix = sparse.csr_matrix((0, len(names)))
+        return matrix, dates, names
+
+    def row_for(self, date) -> Optional[sparse.csr_matrix]:
+        """
+        Reads the features of a single report date from the memory-mapped arrays of its part.
+
+        :param date: The report date.
+        :return: A 1 x n_features CSR matrix, or None if the date is not stored.
+        """
+        if not self.exists():
+            return None
+        dates, offsets = self._index()
+        key = np.datetime64(pd.Timestamp(date).date(), "D")
+        i = np.searchsorted(dates, key)
+        if i >= len(dates) or dates[i] != key:
+            return None
+
+        part = int(np.searchsorted(offsets, i, side="right")) - 1
+        data, indices, indptr = self._load_part(part)
+        row = i - int(offsets[part])
+        start, end = int(indptr[row]), int(indptr[row + 1])
+        return sparse.csr_matrix(
+            (np.array(data[start:end]), np.array(indices[start:end]), np.array([0, end - start])),
+            shape=(1, len(self.feature_names()))
+        )
+
+    def append(self, dates, matrix, feature_names) -> int:
+        """
+        Appends the features of reports newer than the last stored date as a new part.
+        The stored parts are not read or rewritten, and the index is replaced atomically
+        after the part is written. Rows with dates that are already stored are ignored.
+
+        :param dates: Report dates, one per matrix row, in ascending order.
+        :param matrix: A sparse matrix with the TF-IDF features of the reports.
+        :param feature_names: Names of the matrix columns.
+        :raises ValueError: If the feature names differ from the stored ones.
+        :return: The number of appended rows.
+        :rtype: int
+        """
+        dates = np.asarray(pd.to_datetime(dates).values.astype("datetime64[D]"))
+        feature_names = np.asarray(feature_names, dtype=str)
+        matrix = sparse.csr_matrix(matrix)
+
+        if self.exists():
+            if not np.array_equal(self.feature_names(), feature_names):
+                raise ValueError("Feature names differ from the stored ones, rebuild the store")
+            stored_dates, offsets = self._index()
+            if len(stored_dates):
+                new_rows = np.flatnonzero(dates > stored_dates[-1])
+                dates, matrix = dates[new_rows], matrix[new_rows]
+        else:
+            os.makedirs(self.path, exist_ok=True)
+            np.save(self._file(FEATURE_NAMES_FILE), feature_names, allow_pickle=False)
+            stored_dates, offsets = np.array([], dtype="datetime64[D]"), np.array([0], dtype=np.int64)
+
+        if not len(dates):
+            return 0
+
+        part = len(offsets) - 1
+        for name, values in zip(PART_ARRAYS, (matrix.data, matrix.indices, matrix.indptr)):
+            np.save(self._part(part, name), values, allow_pickle=False)
+        self._write_index(np.concatenate([stored_dates, dates]),
+                          np.append(offsets, offsets[-1] + len(dates)).astype(np.int64))
+        return len(dates)
+
+    def _write_index(self, dates, offsets) -> None:
+        tmp_path = self._file(INDEX_FILE + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, dates=dates, offsets=offsets)
+        os.replace(tmp_path, self._file(INDEX_FILE))
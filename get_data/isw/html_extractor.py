@@ -1,7 +1,14 @@
-import pymongo
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 import argparse
 import re
+import time
+from common.mongo import get_client, MONGO_URI, MONGO_DATABASE
+
+PARSERS = ["html.parser", "lxml"]
+# only the report body is built into the tree in selective mode
+CONTENT_STRAINER = SoupStrainer("div", class_="content")
 
 
 def validate_mongodb(mongo):
@@ -10,8 +17,14 @@ def validate_mongodb(mongo):
     return mongo
 
 
-def extract_text_from_html(html_content):
-    soup = BeautifulSoup(html_content, 'html.parser')
+def extract_text_from_html(html_content, parser='html.parser', selective=False):
+    soup = None
+    if selective:
+        soup = BeautifulSoup(html_content, parser, parse_only=CONTENT_STRAINER)
+        if soup.find('div', class_='content') is None:
+            soup = None
+    if soup is None:
+        soup = BeautifulSoup(html_content, parser)
 
     for script in soup(["script", "style", "nav", "footer", "header"]):
         script.extract()
@@ -67,48 +80,85 @@ def clean_extracted_text(text):
     return text.strip()
 
 
-def process_documents(mongo, database, input_collection, output_collection):
+def process_document(doc, parser='html.parser', selective=False):
     try:
-        client = pymongo.MongoClient(mongo)
+        extracted_text = extract_text_from_html(doc["html_content"], parser, selective)
+        return {
+            "date": doc["date"],
+            "extracted_text": clean_extracted_text(extracted_text)
+        }
+    except Exception as e:
+        print(f"Error processing document: {e}")
+        return None
+
+
+def _process_document_args(args):
+    return process_document(*args)
+
+
+def process_documents(mongo, database, input_collection, output_collection,
+                      workers=1, parser='html.parser', selective=False, batch_size=100):
+    try:
+        client = get_client(mongo)
         db = client[database]
         input_coll = db[input_collection]
         output_coll = db[output_collection]
+        processed_dates = set(output_coll.distinct("date"))
     except Exception as e:
         print(f"MongoDB connection error: {e}")
         return
 
-    documents = input_coll.find({})
-    for doc in documents:
-        try:
-            if output_coll.find_one({"date": doc["date"]}):
+    def pending_documents():
+        for doc in input_coll.find({}, {"_id": 0, "date": 1, "html_content": 1}):
+            if doc["date"] in processed_dates:
                 continue
-            html_content = doc["html_content"]
-            extracted_text = extract_text_from_html(html_content)
-            cleaned_text = clean_extracted_text(extracted_text)
+            processed_dates.add(doc["date"])
+            yield doc, parser, selective
 
-            text_doc = {
-                "date": doc["date"],
-                "extracted_text": cleaned_text
-            }
-            output_coll.insert_one(text_doc)
-
-        except Exception as e:
-            print(f"Error processing document: {e}")
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    started = time.perf_counter()
+    count = 0
+    try:
+        documents = pending_documents()
+        while batch := list(islice(documents, batch_size)):
+            if executor:
+                results = executor.map(_process_document_args, batch, chunksize=max(1, len(batch) // (workers * 4)))
+            else:
+                results = map(_process_document_args, batch)
+            text_docs = [doc for doc in results if doc is not None]
+            if text_docs:
+                output_coll.insert_many(text_docs)
+            count += len(text_docs)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    elapsed = time.perf_counter() - started
+    print(f"Processed {count} documents in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.1f} docs/s)")
 
 
 def main():
     parser = argparse.ArgumentParser(description="ISW HTML to Text Extractor")
-    parser.add_argument("--mongo", default="mongodb://localhost:27017/",
+    parser.add_argument("--mongo", default=MONGO_URI,
                         type=validate_mongodb,
-                        help="MongoDB connection string (default: localhost)")
-    parser.add_argument("--database", default="PythonForDs",
+                        help="MongoDB connection string (default: MONGO_URI or localhost)")
+    parser.add_argument("--database", default=MONGO_DATABASE,
                         help="MongoDB database name (default: PythonForDs)")
     parser.add_argument("--input-collection", default="isw_html",
                         help="Input MongoDB collection name (default: isw_html)")
     parser.add_argument("--output-collection", default="isw_report",
                         help="Output MongoDB collection name (default: isw_report)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes (default: 1)")
+    parser.add_argument("--parser", default="html.parser", choices=PARSERS,
+                        help="BeautifulSoup parser backend (default: html.parser)")
+    parser.add_argument("--selective", action="store_true",
+                        help="Only parse the report body (div.content) instead of the whole page")
+    parser.add_argument("--batch-size", type=int, default=100,
+                        help="Number of documents inserted at once (default: 100)")
     args = parser.parse_args()
-    process_documents(args.mongo, args.database, args.input_collection, args.output_collection)
+    process_documents(args.mongo, args.database, args.input_collection, args.output_collection,
+                      args.workers, args.parser, args.selective, args.batch_size)
 
 
 if __name__ == "__main__":
@@ -2,13 +2,17 @@
 ISW (Institute for the Study of War) Report Scraper
 This module provides functionality to scrape war reports from the ISW website.
 """
-from typing import List, Optional
+from typing import List, Optional, Set, Tuple
 import requests
 import pymongo
 import time
 import random
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from common.mongo import get_client, MONGO_URI, MONGO_DATABASE
 
 # Base URL for all ISW reports
 BASE_URL = "https://www.understandingwar.org/backgrounder/"
@@ -22,14 +26,44 @@ URL_PATTERNS = [
     "russian-offensive-campaign-assessment-{}-0"
 ]
 
+# number of URL variants probed at the same time and the timeout for a single request
+URL_WORKERS = 10
+REQUEST_TIMEOUT = 30
+# number of reports upserted in one bulk write in incremental mode
+SAVE_BATCH_SIZE = 50
+# bodies of rejected probes up to this size are read to return the connection to the pool
+PROBE_DRAIN_BYTES = 64 * 1024
+
 
 class ISWReportScraper:
-    def __init__(self, mongo_client: pymongo.MongoClient, database: str, collection: str):
+    def __init__(self, mongo_client: pymongo.MongoClient, database: str, collection: str,
+                 max_workers: int = URL_WORKERS, timeout: float = REQUEST_TIMEOUT):
         self.db = mongo_client[database]
         self.collection = self.db[collection]
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # one pool for the lifetime of the scraper, see `close`
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
         self.month_names = ["january", "february", "march", "april", "may", "june",
                             "july", "august", "september", "october", "november", "december"]
 
+    def close(self) -> None:
+        """
+        Waits for the running URL probes and closes the worker pool and the HTTP session.
+        """
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def format_date(self, date: datetime.date, include_year: bool = True) -> str:
         """
         Formats the given date into a string representation based on the month names
@@ -93,10 +127,104 @@ class ISWReportScraper:
         else:
             self.collection.insert_one(document)
 
+    def save_reports(self, reports: List[Tuple[datetime.date, str, str]]) -> None:
+        """
+        Upserts several reports with a single bulk write, keyed by URL like `save_report`.
+
+        :param reports: A list of (date, url, content) tuples.
+        :type reports: List[Tuple[datetime.date, str, str]]
+        :return: None
+        """
+        if not reports:
+            return
+        operations = [
+            pymongo.UpdateOne(
+                {"url": url},
+                {"$set": {
+                    "date": datetime.combine(date, datetime.min.time()),
+                    "url": url,
+                    "html_content": content
+                }},
+                upsert=True
+            )
+            for date, url, content in reports
+        ]
+        self.collection.bulk_write(operations, ordered=False)
+
+    def existing_dates(self, start_date: datetime.date, end_date: datetime.date) -> Set[datetime.date]:
+        """
+        Returns the dates in the given range that already have a stored report,
+        using a single query that only reads the `date` field.
+
+        :param start_date: The start date of the range.
+        :type start_date: datetime.date
+        :param end_date: The end date of the range.
+        :type end_date: datetime.date
+        :return: A set of dates that are already stored.
+        :rtype: Set[datetime.date]
+        """
+        self.collection.create_index([("date", pymongo.DESCENDING)])
+        cursor = self.collection.find(
+            {"date": {
+                "$gte": datetime.combine(start_date, datetime.min.time()),
+                "$lte": datetime.combine(end_date, datetime.min.time())
+            }},
+            {"date": 1, "_id": 0}
+        )
+        return {doc["date"].date() for doc in cursor}
+
+    def _probe(self, url: str, done: threading.Event) -> Optional[str]:
+        # probes that lost to a preferred URL neither start nor download the body
+        if done.is_set():
+            return None
+        with self.session.get(url, timeout=self.timeout, stream=True) as response:
+            if response.status_code == 200 and not done.is_set():
+                return response.text
+            # an unread response is closed with its connection; small answers such as
+            # the 404 pages are read to the end so the next probe reuses the connection
+            drained = 0
+            for chunk in response.iter_content(8192):
+                drained += len(chunk)
+                if drained > PROBE_DRAIN_BYTES:
+                    break
+            else:
+                response.raw.release_conn()
+        return None
+
+    def fetch_report(self, date: datetime.date) -> Optional[Tuple[str, str]]:
+        """
+        Requests all candidate URLs for the given date concurrently over the pooled
+        session, but keeps the priority of `URL_PATTERNS`: the first URL in pattern
+        order that answers with 200 wins, the same one a sequential scrape would store.
+        The probes of the less preferred URLs are cancelled once a report is found.
+
+        :param date: The target date of the report.
+        :type date: datetime.date
+        :return: A (url, content) tuple, or None if no candidate URL worked.
+        :rtype: Optional[Tuple[str, str]]
+        """
+        done = threading.Event()
+        urls = self.generate_urls(date)
+        futures = [self.executor.submit(self._probe, url, done) for url in urls]
+        try:
+            for url, future in zip(urls, futures):
+                try:
+                    content = future.result()
+                except Exception as e:
+                    print(f"Exception when trying URL {url}: {str(e)}")
+                    continue
+                if content is not None:
+                    return url, content
+        finally:
+            done.set()
+            for future in futures:
+                future.cancel()
+        return None
+
     def scrape_report(self, date: datetime.date) -> Optional[bool]:
         """
-        Scrapes report data for a given date by generating URLs, requesting
-        each, and saving the report if the request succeeds.
+        Scrapes report data for a given date by requesting the generated URLs
+        and saving the report if one of the requests succeeds.
 
         :param date: The target date for which the report is to be scraped.
         :type date: datetime.date
@@ -104,35 +232,49 @@ class ISWReportScraper:
             None if all attempts fail.
         :rtype: Optional[bool]
         """
-        for url in self.generate_urls(date):
-            try:
-                response = requests.get(url)
-                if response.status_code == 200:
-                    self.save_report(date, url, response.text)
-                    return True
-            except Exception as e:
-                print(f"Exception when trying URL {url}: {str(e)}")
+        report = self.fetch_report(date)
+        if report:
+            self.save_report(date, *report)
+            return True
         print(f"Failed for date {date.strftime('%Y-%m-%d')}")
         return None
 
-    def scrape_data(self, start_date: datetime.date, end_date: datetime.date) -> None:
+    def scrape_data(self, start_date: datetime.date, end_date: datetime.date, incremental: bool = False) -> None:
         """
-        Scrapes data for each date in the given date range by calling the scrape_report
-        method for each date. Introduces a random delay between iterations to mimic
-        human behavior.
+        Scrapes data for each date in the given date range. Introduces a random delay
+        between requested dates to mimic human behavior.
+
+        In incremental mode the dates that are already stored are looked up once and
+        skipped, and the downloaded reports are upserted in bulk batches.
 
         :param start_date: The start date of the range to scrape data for.
         :type start_date: datetime.date
         :param end_date: The end date of the range to scrape data for.
         :type end_date: datetime.date
+        :param incremental: Skip stored dates and save reports in batches.
+        :type incremental: bool
         :return: None
         """
+        stored = self.existing_dates(start_date, end_date) if incremental else set()
+        pending = []
         current_date = start_date
         while current_date <= end_date:
-            self.scrape_report(current_date)
-            delay = random.uniform(0.2, 1.0)
-            time.sleep(delay)
+            if current_date not in stored:
+                if incremental:
+                    report = self.fetch_report(current_date)
+                    if report:
+                        pending.append((current_date, *report))
+                    else:
+                        print(f"Failed for date {current_date.strftime('%Y-%m-%d')}")
+                    if len(pending) >= SAVE_BATCH_SIZE:
+                        self.save_reports(pending)
+                        pending = []
+                else:
+                    self.scrape_report(current_date)
+                delay = random.uniform(0.2, 1.0)
+                time.sleep(delay)
             current_date += timedelta(days=1)
+        self.save_reports(pending)
 
 
 def validate_date(date_string: str) -> datetime.date:
@@ -153,13 +295,17 @@ def validate_date(date_string: str) -> datetime.date:
         raise argparse.ArgumentTypeError("Invalid date format. Use YYYY-MM-DD")
 
 
-def main():
+def main(argv: Optional[List[str]] = None):
     """
     Executes the main routine for scraping ISW (Institute for the Study of War) reports
     and storing the results in a MongoDB database. The script allows users to specify
     a date range for which reports are fetched and provides options to configure
     MongoDB connection details.
 
+    :param argv: Command line arguments. Defaults to `sys.argv`; pass an empty list
+        when calling from another program to use the defaults.
+    :type argv: Optional[List[str]]
+
     :raises Exception: If any error occurs while connecting to the MongoDB instance.
 
     :return: None
@@ -173,21 +319,25 @@ def main():
     parser.add_argument("end_date", nargs='?', type=validate_date,
                         default=today,
                         help="End date (YYYY-MM-DD), defaults to today")
-    parser.add_argument("--mongo", default="mongodb://localhost:27017/",
-                        help="MongoDB connection string (default: localhost)")
-    parser.add_argument("--database", default="PythonForDs",
+    parser.add_argument("--mongo", default=MONGO_URI,
+                        help="MongoDB connection string (default: MONGO_URI or localhost)")
+    parser.add_argument("--database", default=MONGO_DATABASE,
                         help="MongoDB database name (default: PythonForDs)")
     parser.add_argument("--collection", default="isw_html",
                         help="MongoDB collection name (default: isw_html)")
-    args = parser.parse_args()
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip dates that are already stored and save reports in bulk")
+    parser.add_argument("--workers", type=int, default=URL_WORKERS,
+                        help=f"Number of URL variants requested in parallel (default: {URL_WORKERS})")
+    args = parser.parse_args(argv)
     if args.start_date > args.end_date:
         print("Start date must be before or equal to end date.")
         return
 
     try:
-        client = pymongo.MongoClient(args.mongo)
-        scraper = ISWReportScraper(client, args.database, args.collection)
-        scraper.scrape_data(args.start_date, args.end_date)
+        client = get_client(args.mongo)
+        with ISWReportScraper(client, args.database, args.collection, max_workers=args.workers) as scraper:
+            scraper.scrape_data(args.start_date, args.end_date, incremental=args.incremental)
 
     except Exception as e:
         print(f"Error connecting to MongoDB: {e}")
@@ -1,13 +1,17 @@
-import pymongo
+import numpy as np
 import pandas as pd
+import pymongo
 import re
+from functools import lru_cache
 from sklearn.feature_extraction.text import TfidfVectorizer
 from get_data.isw import html_extractor, isw_data_scraper
+from get_data.isw.feature_store import IswFeatureStore
+from common.mongo import get_database
+from common.model_registry import registry
 import nltk
 from nltk.corpus import stopwords
 from nltk.stem import WordNetLemmatizer
 from nltk.tokenize import word_tokenize
-import pickle
 
 ISW_FEATURES = ['activity belarus', 'advance russian', 'air defense', 'amid continued',
                 'area ukrainian', 'arm army', 'army corp', 'attack near', 'chasiv yar',
@@ -40,65 +44,198 @@ ISW_FEATURES = ['activity belarus', 'advance russian', 'air defense', 'amid cont
                 'vdv division', 'velyka novosilka', 'vladimir putin', 'wagner group',
                 'war ukraine', 'western zaporizhia', 'zaporizhia oblast']
 
+# features of the most recent processed report, reused until a newer report arrives
+_latest_features = {}
+
 MONTHS = {
     "january", "february", "march", "april", "may", "june",
     "july", "august", "september", "october", "november", "december"
 }
 
 
+VECTORIZER_PATH = "models/tfidf_vectorizer.pkl"
+
+
+@lru_cache(maxsize=None)
+def get_stop_words() -> frozenset:
+    return frozenset(stopwords.words("english"))
+
+
+def warm_up() -> None:
+    """
+    Loads the NLTK corpora and the TF-IDF vectorizer ahead of the first run, so that a
+    long-running process pays for them once.
+    """
+    get_stop_words()
+    lemmatize("reports")
+    registry.get(VECTORIZER_PATH)
+
+
+NON_ALPHA_PATTERN = re.compile(r"[^a-zA-Z\s]")
+# word_tokenize splits these words in two, every other cleaned token is kept as is
+TOKENIZER_CONTRACTIONS = frozenset({"cannot", "gimme", "gonna", "gotta", "lemme", "wanna"})
+LEMMA_CACHE_SIZE = 100_000
+
+
+def _clean_tokens(text: str) -> list:
+    # after the non-letters are replaced only ASCII letters and whitespace remain,
+    # so dropping words of one or two letters is a length check on the split tokens
+    return [t for t in NON_ALPHA_PATTERN.sub(" ", text).lower().split() if len(t) > 2]
+
+
 def clean_text(text: str) -> str:
-    text = re.sub(r"[^a-zA-Z\s]", " ", text)
-    text = text.lower()
-    text = re.sub(r"\d+", "", text)
-    text = re.sub(r"\b\w{1,2}\b", "", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
+    return " ".join(_clean_tokens(text))
+
+
+@lru_cache(maxsize=None)
+def get_lemmatizer() -> WordNetLemmatizer:
+    return WordNetLemmatizer()
+
+
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def lemmatize(word: str) -> str:
+    return get_lemmatizer().lemmatize(word)
 
 
 def preprocess_text(text: str, stop_words: set, months: set) -> str:
     tokens = word_tokenize(text)
     tokens = [t for t in tokens if t not in stop_words and t not in months]
-    lemmatizer = WordNetLemmatizer()
-    lemmatized = [lemmatizer.lemmatize(word) for word in tokens]
+    lemmatized = [lemmatize(word) for word in tokens]
     return " ".join(lemmatized)
 
 
+class TextNormalizer:
+    """
+    Turns extracted report text into the lemmatized text the TF-IDF vectorizer expects.
+    The result is identical to `preprocess_text(clean_text(text), ...)`, but the text is
+    cleaned with one regex pass, tokenized by a single split and lemmatized through the
+    shared LRU-cached lemmatizer.
+    """
+
+    def __init__(self, stop_words: set = None, months: set = MONTHS):
+        stop_words = get_stop_words() if stop_words is None else stop_words
+        self.excluded = frozenset(stop_words) | frozenset(months)
+
+    def tokenize(self, text: str) -> list:
+        tokens = _clean_tokens(text)
+        if TOKENIZER_CONTRACTIONS.isdisjoint(tokens):
+            return tokens
+        return word_tokenize(" ".join(tokens))
+
+    def normalize(self, text: str) -> str:
+        return " ".join(lemmatize(t) for t in self.tokenize(text) if t not in self.excluded)
+
+    def normalize_many(self, texts) -> list:
+        return [self.normalize(text) for text in texts]
+
+
+# (database, collection) pairs whose date index has been created by this process
+_indexed_collections = set()
+
+
+def _report_collection(db_name: str, collection_name: str):
+    # The collection comes from the shared client on every call, so a fork or
+    # `set_client` is picked up; only the index creation is done once
+    collection = get_database(db_name)[collection_name]
+    if (db_name, collection_name) not in _indexed_collections:
+        collection.create_index([("date", pymongo.DESCENDING)])
+        _indexed_collections.add((db_name, collection_name))
+    return collection
+
+
+def get_latest_isw_date(db_name: str = "PythonForDs", collection_name: str = "isw_html"):
+    latest_doc = _report_collection(db_name, collection_name).find_one(
+        {}, {"_id": 0, "date": 1}, sort=[("date", pymongo.DESCENDING)]
+    )
+    return latest_doc["date"] if latest_doc else None
+
+
 def get_latest_isw_html(db_name: str = "PythonForDs", collection_name: str = "isw_html") -> str:
-    client = pymongo.MongoClient("mongodb://localhost:27017")
-    db = client[db_name]
-    collection = db[collection_name]
-    latest_doc = list(collection.find())[-1]
+    latest_doc = _report_collection(db_name, collection_name).find_one(
+        {}, {"_id": 0, "html_content": 1}, sort=[("date", pymongo.DESCENDING)]
+    )
     return latest_doc["html_content"]
 
 
-def vectorize_isw_features(text: str, features: list) -> pd.DataFrame:
-    with open( "models/tfidf_vectorizer.pkl", "rb") as f:
-        vectorizer = pickle.load(f)
+def select_features(tfidf_matrix, vectorizer, features: list = None) -> pd.DataFrame:
+    """
+    Densifies only the requested TF-IDF columns of a sparse matrix.
+
+    :param tfidf_matrix: Sparse TF-IDF matrix produced by `vectorizer`.
+    :param vectorizer: The fitted TF-IDF vectorizer.
+    :param features: Column names to keep, names outside the vocabulary are ignored.
+        All vocabulary columns are kept when None.
+    :return: A DataFrame with the selected columns in the requested order.
+    """
+    if features is None:
+        return pd.DataFrame(tfidf_matrix.toarray(), columns=vectorizer.get_feature_names_out())
+
+    vocabulary = vectorizer.vocabulary_
+    selected = [f for f in features if f in vocabulary]
+    columns = [vocabulary[f] for f in selected]
+    return pd.DataFrame(tfidf_matrix[:, columns].toarray(), columns=selected)
+
+
+def vectorize_isw_features(text: str, features: list = None) -> pd.DataFrame:
+    vectorizer = registry.get(VECTORIZER_PATH)
 
     tfidf_matrix = vectorizer.transform([text])
-    return pd.DataFrame(tfidf_matrix.toarray(), columns=vectorizer.get_feature_names_out())
+    return select_features(tfidf_matrix, vectorizer, features)
+
+
+def load_stored_features(report_date, vectorizer, store: IswFeatureStore = None, features: list = None):
+    """
+    Reads the features of a report from the backfilled feature store, if it has them
+    and they were produced by the same vectorizer vocabulary.
+
+    :return: A one-row DataFrame like `vectorize_isw_features`, or None.
+    """
+    store = store or IswFeatureStore()
+    if report_date is None or not store.exists():
+        return None
+    row = store.row_for(report_date)
+    feature_names = vectorizer.get_feature_names_out()
+    if row is None or not np.array_equal(store.feature_names(), feature_names):
+        return None
+    return select_features(row, vectorizer, features)
 
 
-def main():
+def main(columns: list = None):
+    """
+    Updates the ISW reports and returns the TF-IDF features of the latest one.
+
+    :param columns: Input columns of the model. Only the vectorizer features among them
+        are computed, or every vectorizer feature when None.
+    :return: A one-row DataFrame with the features, or None if an error occurred.
+    """
     # Uncomment if you run for the first time
     # nltk.download("punkt")
     # nltk.download("punkt_tab")
     # nltk.download("stopwords")
     # nltk.download("wordnet")
 
-    stop_words = set(stopwords.words("english"))
+    stop_words = get_stop_words()
 
     try:
-        isw_data_scraper.main()
+        isw_data_scraper.main(["--incremental"])
+
+        report_date = get_latest_isw_date()
+        vectorizer = registry.get(VECTORIZER_PATH)
+        cache_key = (report_date, tuple(columns) if columns is not None else None)
+        if _latest_features.get("key") == cache_key and _latest_features.get("vectorizer") is vectorizer:
+            return _latest_features["features"]
 
-        raw_html = get_latest_isw_html()
-        extracted_text = html_extractor.extract_text_from_html(raw_html)
-        cleaned_raw_text = html_extractor.clean_extracted_text(extracted_text)
-        cleaned_text = clean_text(cleaned_raw_text)
+        features = load_stored_features(report_date, vectorizer, features=columns)
+        if features is None:
+            raw_html = get_latest_isw_html()
+            extracted_text = html_extractor.extract_text_from_html(raw_html)
+            cleaned_raw_text = html_extractor.clean_extracted_text(extracted_text)
 
-        final_text = preprocess_text(cleaned_text, stop_words, MONTHS)
+            final_text = TextNormalizer(stop_words).normalize(cleaned_raw_text)
 
-        return vectorize_isw_features(final_text, ISW_FEATURES)
+            features = vectorize_isw_features(final_text, columns)
+        _latest_features.update(key=cache_key, vectorizer=vectorizer, features=features)
+        return features
 
     except Exception as e:
         print(f"Error occurred: {e}")
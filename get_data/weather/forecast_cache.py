@@ -0,0 +1,150 @@
+"""
+Local cache for Visual Crossing forecasts.
+A multi-day forecast is fetched once per region and every hourly run slices its own
+24-hour window out of it. Entries are kept in memory and in one JSON file per region,
+so short-lived runs started by cron share the cache too. An entry is fresh for `ttl`
+seconds; for the following `stale_ttl` seconds it is still served while a background
+refresh revalidates it with a conditional request.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+WEATHER_CACHE_DIR = os.getenv("WEATHER_CACHE_DIR", "prepared_data/weather_cache")
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "10800"))
+WEATHER_CACHE_STALE_TTL = float(os.getenv("WEATHER_CACHE_STALE_TTL", "10800"))
+REVALIDATE_WORKERS = 2
+
+FRESH = "fresh"
+STALE = "stale"
+EXPIRED = "expired"
+
+
+class ForecastCache:
+    def __init__(self, path: str = WEATHER_CACHE_DIR, ttl: float = WEATHER_CACHE_TTL,
+                 stale_ttl: float = WEATHER_CACHE_STALE_TTL):
+        """
+        :param path: Directory for the cached payloads, or None to keep them in memory only.
+        :type path: str
+        :param ttl: Seconds an entry is served without contacting the API.
+        :type ttl: float
+        :param stale_ttl: Seconds after `ttl` during which an entry is still served while
+            it is refreshed in the background.
+        :type stale_ttl: float
+        """
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = {}
+        self._refreshing = set()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.json")
+
+    def get(self, key: str):
+        """
+        :param key: Region key, e.g. the city name.
+        :type key: str
+        :return: The cached entry, or None if the region was never fetched.
+        :rtype: dict
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None or not self.path:
+            return entry
+
+        try:
+            with open(self._file(key), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            return self._entries.setdefault(key, entry)
+
+    def put(self, key: str, entry: dict) -> None:
+        """
+        Stores an entry in memory and, if a directory is configured, on disk.
+
+        :param key: Region key.
+        :type key: str
+        :param entry: A dict with the `payload`, the fetched date range (`start`, `end`),
+            `fetched_at` (last download or revalidation) and `downloaded_at` (last download
+            of the payload) as UNIX timestamps and the `etag`/`last_modified` validators.
+        :type entry: dict
+        """
+        with self._lock:
+            self._entries[key] = entry
+        if not self.path:
+            return
+
+        os.makedirs(self.path, exist_ok=True)
+        tmp_file = self._file(key) + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_file, self._file(key))
+
+    def state(self, entry: dict, now: float = None) -> str:
+        """
+        :param entry: A cached entry.
+        :type entry: dict
+        :param now: Current UNIX timestamp, defaults to `time.time()`.
+        :type now: float
+        :return: `FRESH`, `STALE` or `EXPIRED` depending on the age of the entry.
+        :rtype: str
+        """
+        age = (time.time() if now is None else now) - entry["fetched_at"]
+        if age < self.ttl:
+            return FRESH
+        if age < self.ttl + self.stale_ttl:
+            return STALE
+        return EXPIRED
+
+    def revalidate(self, key: str, refresh) -> bool:
+        """
+        Refreshes an entry in the background, unless a refresh of it is already running.
+
+        :param key: Region key.
+        :type key: str
+        :param refresh: Callable returning the new entry.
+        :return: True if a refresh was scheduled.
+        :rtype: bool
+        """
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=REVALIDATE_WORKERS)
+            executor = self._executor
+
+        def run():
+            try:
+                self.put(key, refresh())
+            except Exception as e:
+                print(f"Error revalidating weather for {key}: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        executor.submit(run)
+        return True
+
+    def wait(self) -> None:
+        """
+        Waits for the running background refreshes to finish.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def clear(self) -> None:
+        """
+        Forgets the entries kept in memory. Files on disk are left untouched.
+        """
+        with self._lock:
+            self._entries.clear()
@@ -2,7 +2,14 @@ import datetime as dt
 import requests
 import os
 import pymongo
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from common.mongo import get_collection
+from common.regions import PREDICTED_REGIONS
+from get_data.weather.forecast_cache import FRESH, STALE, ForecastCache
 
 load_dotenv()
 
@@ -12,33 +19,65 @@ VISUAL_CROSSING_API_KEY = os.getenv("VISUAL_CROSSING_API_KEY")
 if not API_TOKEN or not VISUAL_CROSSING_API_KEY:
     raise ValueError("Missing API keys. Please set them in the .env file.")
 
-REGIONS = {
-    "Львівська": "Lviv",
-    "Київська": "Kyiv",
-    "Київ": "Kyiv",
-    "Харківська": "Kharkiv",
-    "Одеська": "Odesa",
-    "Дніпропетровська": "Dnipro",
-    "Запорізька": "Zaporizhzhia",
-    "Вінницька": "Vinnytsia",
-    "Полтавська": "Poltava",
-    "Житомирська": "Zhytomyr",
-    "Хмельницька": "Khmelnytskyi",
+WEATHER_API_URL = os.getenv(
+    "WEATHER_API_URL",
+    "https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline"
+)
+MAX_WORKERS = int(os.getenv("WEATHER_MAX_WORKERS", "8"))
+PER_HOST_LIMIT = int(os.getenv("WEATHER_PER_HOST_LIMIT", "8"))
+REQUEST_TIMEOUT = float(os.getenv("WEATHER_REQUEST_TIMEOUT", "10"))
+MAX_RETRIES = int(os.getenv("WEATHER_MAX_RETRIES", "3"))
+BACKOFF_FACTOR = float(os.getenv("WEATHER_BACKOFF_FACTOR", "0.5"))
+FORECAST_DAYS = int(os.getenv("WEATHER_FORECAST_DAYS", "3"))
+WEATHER_COLLECTION = "weather_hourly"
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Forecasts are requested for a city of every region: the regional center unless the API knows it
+# under another spelling or the center is occupied
+WEATHER_CITY_OVERRIDES = {
     "Закарпатська": "Uzhhorod",
-    "Івано-Франківська": "Ivano-Frankivsk",
-    "Чернівецька": "Chernivtsi",
-    "Тернопільська": "Ternopil",
-    "Черкаська": "Cherkasy",
-    "Кіровоградська": "Kropyvnytskyi",
-    "Миколаївська": "Mykolaiv",
-    "Херсонська": "Kherson",
-    "Сумська": "Sumy",
-    "Чернігівська": "Chernihiv",
-    "Рівненська": "Rivne",
-    "Волинська": "Lutsk",
-    "Донецька": "Kramatorsk"
+    "Запорізька": "Zaporizhzhia",
+    "Донецька": "Kramatorsk",
+}
+REGIONS = {
+    **{region.name: WEATHER_CITY_OVERRIDES.get(region.name, region.center_city_en) for region in PREDICTED_REGIONS},
+    "Київ": "Kyiv"
+}
+
+
+# Columns of the flat `weather_hourly` collection, in the order the model was trained on
+WEATHER_DTYPES = {
+    "datetime": "datetime64[ns]",
+    "city_latitude": "float64",
+    "city_longitude": "float64",
+    "day_tempmax": "float64",
+    "day_tempmin": "float64",
+    "day_temp": "float64",
+    "day_precipcover": "float64",
+    "day_moonphase": "float64",
+    "hour_temp": "float64",
+    "hour_humidity": "float64",
+    "hour_dew": "float64",
+    "hour_precip": "float64",
+    "hour_precipprob": "float64",
+    "hour_snow": "float64",
+    "hour_snowdepth": "float64",
+    "hour_preciptype": "object",
+    "hour_windgust": "float64",
+    "hour_windspeed": "float64",
+    "hour_winddir": "float64",
+    "hour_pressure": "float64",
+    "hour_visibility": "float64",
+    "hour_cloudcover": "float64",
+    "hour_solarradiation": "float64",
+    "hour_solarenergy": "float64",
+    "hour_uvindex": "float64",
+    "hour_conditions": "object",
+    "region": "object",
 }
 
+forecast_cache = ForecastCache()
+
 
 class InvalidUsage(Exception):
     status_code = 400
@@ -56,7 +95,234 @@ class InvalidUsage(Exception):
         return rv
 
 
-def get_hourly_weather_data(region: str, region_name: str):
+def create_session(per_host_limit: int = PER_HOST_LIMIT, retries: int = MAX_RETRIES,
+                   backoff_factor: float = BACKOFF_FACTOR) -> requests.Session:
+    """
+    Creates a pooled HTTP session for the weather API. The connection pool blocks once
+    `per_host_limit` connections to the same host are in use, which caps the number of
+    concurrent requests per host regardless of how many workers share the session.
+    Failed connections and retryable statuses are retried with exponential backoff.
+
+    :param per_host_limit: Maximum number of simultaneous connections per host.
+    :type per_host_limit: int
+    :param retries: Maximum number of retries for a single request.
+    :type retries: int
+    :param backoff_factor: Backoff factor between retries, in seconds.
+    :type backoff_factor: float
+    :return: A configured requests session.
+    :rtype: requests.Session
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET"]),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_maxsize=per_host_limit, pool_block=True, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def parse_hourly_forecast(data: dict, region_name: str, start: dt.datetime, hours: int = 24) -> list:
+    """
+    Slices the hourly forecast for `hours` hours starting at `start` out of a
+    (possibly multi-day) timeline API payload.
+
+    :param data: The decoded timeline API response.
+    :type data: dict
+    :param region_name: The name of the region in Ukrainian.
+    :type region_name: str
+    :param start: The first hour of the window.
+    :type start: datetime.datetime
+    :param hours: Number of hours to return.
+    :type hours: int
+    :return: A list of hourly forecast documents.
+    :rtype: list
+    """
+    start = start.replace(minute=0, second=0, microsecond=0)
+    hourly_data = []
+    hours_needed = hours
+
+    city_latitude = data.get("latitude")
+    city_longitude = data.get("longitude")
+
+    for day in data.get("days", []):
+        day_tempmax = day.get("tempmax")
+        day_tempmin = day.get("tempmin")
+        day_temp = day.get("temp")
+        day_precipcover = day.get("precipcover", 0)
+        day_moonphase = day.get("moonphase", 0)
+
+        for hour_data in day.get("hours", []):
+            hour_datetime = f"{day.get('datetime')}T{hour_data.get('datetime')}"
+
+            if dt.datetime.fromisoformat(hour_datetime) < start:
+                continue
+
+            hourly_data.append({
+                "datetime": hour_datetime,
+                "city_latitude": city_latitude,
+                "city_longitude": city_longitude,
+                "day_tempmax": day_tempmax,
+                "day_tempmin": day_tempmin,
+                "day_temp": day_temp,
+                "day_precipcover": day_precipcover,
+                "day_moonphase": day_moonphase,
+                "hour_temp": hour_data.get("temp"),
+                "hour_humidity": hour_data.get("humidity"),
+                "hour_dew": hour_data.get("dew"),
+                "hour_precip": hour_data.get("precip", 0),
+                "hour_precipprob": hour_data.get("precipprob", 0),
+                "hour_snow": hour_data.get("snow", 0),
+                "hour_snowdepth": hour_data.get("snowdepth", 0),
+                "hour_preciptype": hour_data.get("preciptype", ""),
+                "hour_windgust": hour_data.get("windgust", 0),
+                "hour_windspeed": hour_data.get("windspeed", 0),
+                "hour_winddir": hour_data.get("winddir", 0),
+                "hour_pressure": hour_data.get("pressure", 0),
+                "hour_visibility": hour_data.get("visibility", 0),
+                "hour_cloudcover": hour_data.get("cloudcover", 0),
+                "hour_solarradiation": hour_data.get("solarradiation", 0),
+                "hour_solarenergy": hour_data.get("solarenergy", 0),
+                "hour_uvindex": hour_data.get("uvindex", 0),
+                "hour_conditions": hour_data.get("conditions", ""),
+                "region": region_name
+            })
+
+            hours_needed -= 1
+            if hours_needed <= 0:
+                break
+
+        if hours_needed <= 0:
+            break
+
+    return hourly_data
+
+
+def download_forecast(region: str, start: dt.date, session: requests.Session = None,
+                      timeout: float = REQUEST_TIMEOUT, cached: dict = None,
+                      days: int = FORECAST_DAYS) -> dict:
+    """
+    Downloads the forecast of a region for `days` days starting at `start`. When a cached
+    entry is given, its validators are sent and a `304 Not Modified` answer reuses its payload.
+
+    :param region: The city name used by the weather API.
+    :type region: str
+    :param start: The first forecast day.
+    :type start: datetime.date
+    :param session: Optional pooled session, `requests.get` is used otherwise.
+    :type session: requests.Session
+    :param timeout: Per-request timeout in seconds.
+    :type timeout: float
+    :param cached: A previously cached entry for the same region, if any.
+    :type cached: dict
+    :param days: Number of forecast days to request.
+    :type days: int
+    :raises InvalidUsage: If the API answers with an error status.
+    :return: A cache entry (see `ForecastCache.put`).
+    :rtype: dict
+    """
+    city = region + ", Ukraine"
+    start_date = start.strftime("%Y-%m-%d")
+    end_date = (start + dt.timedelta(days=days - 1)).strftime("%Y-%m-%d")
+
+    url = f"{WEATHER_API_URL}/{city}/{start_date}/{end_date}?unitGroup=metric&include=hours&key={VISUAL_CROSSING_API_KEY}&contentType=json"
+
+    headers = {}
+    same_range = cached is not None and (cached["start"], cached["end"]) == (start_date, end_date)
+    if same_range and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if same_range and cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+
+    http = session or requests
+    response = http.get(url, headers=headers, timeout=timeout)
+
+    if response.status_code == requests.codes.not_modified and same_range:
+        return dict(cached, fetched_at=time.time())
+    if response.status_code != requests.codes.ok:
+        raise InvalidUsage(response.text, status_code=response.status_code)
+
+    return {
+        "start": start_date,
+        "end": end_date,
+        "fetched_at": time.time(),
+        "downloaded_at": time.time(),
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "payload": response.json()
+    }
+
+
+def covers(entry: dict, start: dt.datetime, hours: int = 24) -> bool:
+    """
+    :return: True if the date range of a cached entry contains the whole window.
+    :rtype: bool
+    """
+    first_day = dt.date.fromisoformat(entry["start"])
+    after_last_day = dt.date.fromisoformat(entry["end"]) + dt.timedelta(days=1)
+    window_end = start + dt.timedelta(hours=hours - 1)
+    return first_day <= start.date() and window_end.date() < after_last_day
+
+
+def get_forecast(region: str, start: dt.datetime, session: requests.Session = None,
+                 timeout: float = REQUEST_TIMEOUT, cache: ForecastCache = None) -> dict:
+    """
+    Returns the forecast entry of a region, from the cache when possible.
+    A fresh cached entry is returned as is, a stale one is returned while it is
+    revalidated in the background, anything else is downloaded synchronously.
+
+    :param region: The city name used by the weather API.
+    :type region: str
+    :param start: The first hour that has to be covered by the payload.
+    :type start: datetime.datetime
+    :param session: Optional pooled session.
+    :type session: requests.Session
+    :param timeout: Per-request timeout in seconds.
+    :type timeout: float
+    :param cache: Forecast cache, or None to always download.
+    :type cache: ForecastCache
+    :return: A cache entry with the decoded timeline API response as `payload`
+        (see `download_forecast`).
+    :rtype: dict
+    """
+    if cache is None:
+        return download_forecast(region, start.date(), session, timeout)
+
+    cached = cache.get(region)
+    if cached is not None and covers(cached, start):
+        state = cache.state(cached)
+        if state == FRESH:
+            return cached
+        if state == STALE:
+            cache.revalidate(region, lambda: _revalidate(region, start.date(), timeout, cached))
+            return cached
+
+    entry = download_forecast(region, start.date(), session, timeout, cached)
+    cache.put(region, entry)
+    return entry
+
+
+def downloaded_at(entry: dict) -> dt.datetime:
+    """
+    :return: When the payload of a forecast entry was downloaded. Revalidations answered
+        with `304 Not Modified` keep the time of the original download.
+    :rtype: datetime.datetime
+    """
+    return dt.datetime.fromtimestamp(entry.get("downloaded_at", entry["fetched_at"]), dt.timezone.utc)
+
+
+def _revalidate(region: str, start: dt.date, timeout: float, cached: dict) -> dict:
+    # Runs after the caller may have closed its session, so it uses its own.
+    with create_session() as session:
+        return download_forecast(region, start, session, timeout, cached)
+
+
+def get_hourly_weather_data(region: str, region_name: str, session: requests.Session = None,
+                            timeout: float = REQUEST_TIMEOUT, cache: ForecastCache = None):
     """
     Fetches and processes hourly weather forecast data for the specified region.
 
@@ -66,126 +332,156 @@ def get_hourly_weather_data(region: str, region_name: str):
     :param region_name: The name of the region in Ukrainian.
     :type region_name: str
 
+    :param session: Optional pooled session (see `create_session`). A plain
+        `requests.get` is used when it is not given.
+    :type session: requests.Session
+
+    :param timeout: Per-request timeout in seconds.
+    :type timeout: float
+
+    :param cache: Optional forecast cache (see `ForecastCache`). Every call hits the
+        API when it is not given.
+    :type cache: ForecastCache
+
     :return: A dictionary containing the region name, an array of hourly forecast data
-        for the next 24 hours, and the timestamp of when the data was collected.
+        for the next 24 hours, and the timestamp of when the forecast was downloaded from the API.
     :rtype: dict
     """
-    city = region + ", Ukraine"
-    if not city:
-        raise InvalidUsage(f"{region} is not found", status_code=400)
+    try:
+        start = dt.datetime.now().replace(minute=0, second=0, microsecond=0)
+        entry = get_forecast(region, start, session, timeout, cache)
+
+        # A forecast served from the cache keeps the time it was downloaded, so it is
+        # archived once and not again as a new collection on every run
+        return {
+            "region": region_name,
+            "hourly_forecast": parse_hourly_forecast(entry["payload"], region_name, start),
+            "collected_at": downloaded_at(entry).isoformat()
+        }
+    except Exception as e:
+        raise InvalidUsage(f"Error getting weather data: {str(e)}", status_code=500)
 
-    today = dt.datetime.now().strftime("%Y-%m-%d")
-    tomorrow = (dt.datetime.now() + dt.timedelta(days=1)).strftime("%Y-%m-%d")
 
-    url = f"https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline/{city}/{today}/{tomorrow}?unitGroup=metric&include=hours&key={VISUAL_CROSSING_API_KEY}&contentType=json"
+def fetch_all_regions(regions: dict = None, max_workers: int = MAX_WORKERS,
+                      session: requests.Session = None, cache: ForecastCache = None) -> list:
+    """
+    Fetches hourly weather data for all regions concurrently using a bounded thread pool
+    that shares one pooled session, so the whole refresh costs roughly one round trip
+    instead of one per region.
+
+    :param regions: Mapping of Ukrainian region names to city names. Defaults to `REGIONS`.
+    :type regions: dict
+    :param max_workers: Number of worker threads.
+    :type max_workers: int
+    :param session: Optional session to reuse. A new one is created (and closed) otherwise.
+    :type session: requests.Session
+    :param cache: Optional forecast cache shared by all regions.
+    :type cache: ForecastCache
+    :return: A list of weather documents for the regions that were fetched successfully.
+        Errors for individual regions are logged and skipped.
+    :rtype: list
+    """
+    regions = REGIONS if regions is None else regions
+    own_session = session is None
+    session = session or create_session()
 
+    results = []
     try:
-        response = requests.get(url)
-
-        if response.status_code == requests.codes.ok:
-            data = response.json()
-            current_hour = dt.datetime.now().hour
-
-            hourly_data = []
-            hours_needed = 24
-
-            city_latitude = data.get("latitude")
-            city_longitude = data.get("longitude")
-
-            for day in data.get("days", []):
-                day_tempmax = day.get("tempmax")
-                day_tempmin = day.get("tempmin")
-                day_temp = day.get("temp")
-                day_precipcover = day.get("precipcover", 0)
-                day_moonphase = day.get("moonphase", 0)
-
-                for hour_data in day.get("hours", []):
-                    hour_time = dt.datetime.strptime(hour_data.get("datetime"), "%H:%M:%S")
-                    hour = hour_time.hour
-
-                    if day == data.get("days", [])[0] and hour < current_hour:
-                        continue
-
-                    hour_datetime = f"{day.get('datetime')}T{hour_data.get('datetime')}"
-
-                    hourly_data.append({
-                        "datetime": hour_datetime,
-                        "city_latitude": city_latitude,
-                        "city_longitude": city_longitude,
-                        "day_tempmax": day_tempmax,
-                        "day_tempmin": day_tempmin,
-                        "day_temp": day_temp,
-                        "day_precipcover": day_precipcover,
-                        "day_moonphase": day_moonphase,
-                        "hour_temp": hour_data.get("temp"),
-                        "hour_humidity": hour_data.get("humidity"),
-                        "hour_dew": hour_data.get("dew"),
-                        "hour_precip": hour_data.get("precip", 0),
-                        "hour_precipprob": hour_data.get("precipprob", 0),
-                        "hour_snow": hour_data.get("snow", 0),
-                        "hour_snowdepth": hour_data.get("snowdepth", 0),
-                        "hour_preciptype": hour_data.get("preciptype", ""),
-                        "hour_windgust": hour_data.get("windgust", 0),
-                        "hour_windspeed": hour_data.get("windspeed", 0),
-                        "hour_winddir": hour_data.get("winddir", 0),
-                        "hour_pressure": hour_data.get("pressure", 0),
-                        "hour_visibility": hour_data.get("visibility", 0),
-                        "hour_cloudcover": hour_data.get("cloudcover", 0),
-                        "hour_solarradiation": hour_data.get("solarradiation", 0),
-                        "hour_solarenergy": hour_data.get("solarenergy", 0),
-                        "hour_uvindex": hour_data.get("uvindex", 0),
-                        "hour_conditions": hour_data.get("conditions", ""),
-                        "region": region_name
-                    })
-
-                    hours_needed -= 1
-                    if hours_needed <= 0:
-                        break
-
-                if hours_needed <= 0:
-                    break
-
-            return {
-                "region": region_name,
-                "hourly_forecast": hourly_data,
-                "collected_at": dt.datetime.now(dt.timezone.utc).isoformat()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(get_hourly_weather_data, region_en, region_ua, session, cache=cache): region_en
+                for region_ua, region_en in regions.items()
             }
-        else:
-            raise InvalidUsage(response.text, status_code=response.status_code)
-    except Exception as e:
-        raise InvalidUsage(f"Error getting weather data: {str(e)}", status_code=500)
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    print(f"Error handling weather for {futures[future]}: {str(e)}")
+    finally:
+        if own_session:
+            session.close()
 
+    return results
 
-def main():
+
+def flatten_weather(documents: list) -> list:
     """
-    Collects hourly weather data for predefined regions and saves it into a MongoDB
-    collection.
+    Turns per-region weather documents into one typed row per region and hour:
+    datetimes are parsed and numeric values are stored as floats.
+
+    :param documents: Documents returned by `get_hourly_weather_data`.
+    :type documents: list
+    :return: A list of flat rows with the fields of `WEATHER_DTYPES` and `collected_at`.
+    :rtype: list
+    """
+    rows = []
+    for doc in documents:
+        collected_at = dt.datetime.fromisoformat(doc["collected_at"])
+        for hour in doc["hourly_forecast"]:
+            row = {}
+            for field, dtype in WEATHER_DTYPES.items():
+                value = hour.get(field)
+                if field == "datetime":
+                    value = dt.datetime.fromisoformat(value)
+                elif dtype == "float64" and value is not None:
+                    value = float(value)
+                row[field] = value
+            row["region"] = doc["region"]
+            row["collected_at"] = collected_at
+            rows.append(row)
+    return rows
+
+
+def save_weather(documents: list, collection) -> None:
+    """
+    Stores the forecasts as flat rows keyed by (region, datetime) with a single unordered
+    bulk write. Hours of the updated regions that are older than their new window are removed.
+
+    :param documents: Documents returned by `get_hourly_weather_data`.
+    :type documents: list
+    :param collection: The MongoDB collection with hourly weather rows.
+    """
+    rows = flatten_weather(documents)
+    if not rows:
+        return
+    collection.create_index([
+        ("region", pymongo.ASCENDING),
+        ("datetime", pymongo.ASCENDING)
+    ], unique=True)
+
+    window_starts = {}
+    operations = []
+    for row in rows:
+        key = {"region": row["region"], "datetime": row["datetime"]}
+        operations.append(pymongo.ReplaceOne(key, row, upsert=True))
+        window_starts[row["region"]] = min(row["datetime"], window_starts.get(row["region"], row["datetime"]))
+    for region, window_start in window_starts.items():
+        operations.append(pymongo.DeleteMany({"region": region, "datetime": {"$lt": window_start}}))
+    collection.bulk_write(operations, ordered=False)
+
+
+def main(max_workers: int = MAX_WORKERS, cache: ForecastCache = forecast_cache):
+    """
+    Collects hourly weather data for predefined regions and saves it into the flat
+    `weather_hourly` MongoDB collection, one row per region and hour, and appends it
+    to the `weather_archive`. Forecasts are served from `cache` while they are fresh.
+
+    :param max_workers: Number of concurrent requests to the weather API.
+    :type max_workers: int
+    :param cache: Forecast cache, or None to fetch every region from the API.
+    :type cache: ForecastCache
 
     :raises Exception: If there is an error connecting to the MongoDB database.
                   Errors related to individual weather data retrieval are logged
                   but do not cause the main process to terminate.
     """
+    # Imported here because the archive reuses the row schema defined in this module
+    from get_data.weather.weather_archive import WeatherArchive
+
     try:
-        client = pymongo.MongoClient("mongodb://localhost:27017")
-        db = client["PythonForDs"]
-        weather_collection = db["weather"]
-
-        weather_collection.create_index([
-            ("region", pymongo.ASCENDING)
-        ], unique=True)
-
-        for region_ua, region_en in REGIONS.items():
-            try:
-                weather_data = get_hourly_weather_data(region_en, region_ua)
-
-                weather_collection.update_one(
-                    {"region": region_ua},
-                    {"$set": weather_data},
-                    upsert=True
-                )
-
-            except Exception as e:
-                print(f"Error handling weather for {region_en}: {str(e)}")
+        weather_data = fetch_all_regions(max_workers=max_workers, cache=cache)
+        save_weather(weather_data, get_collection(WEATHER_COLLECTION))
+        WeatherArchive().append(weather_data)
 
     except Exception as e:
         print(f"Database error: {str(e)}")
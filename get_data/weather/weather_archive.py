@@ -0,0 +1,188 @@
+"""
+Append-only archive of every collected weather forecast.
+`weather_hourly` only holds the latest forecast, while the archive keeps one row per
+(region, collected_at, target hour), so training and offline evaluation can replay
+what the forecast looked like at any point in time. Rows older than the retention
+period are removed by a MongoDB TTL index.
+"""
+import argparse
+import datetime as dt
+import os
+import pandas as pd
+import pymongo
+from pymongo.errors import BulkWriteError, OperationFailure
+from common.mongo import get_collection
+from get_data.weather.get_weather import WEATHER_DTYPES, flatten_weather
+
+WEATHER_ARCHIVE_COLLECTION = "weather_archive"
+WEATHER_ARCHIVE_RETENTION_DAYS = int(os.getenv("WEATHER_ARCHIVE_RETENTION_DAYS", "0"))
+ARCHIVE_DTYPES = {**WEATHER_DTYPES, "collected_at": "datetime64[ns]"}
+TTL_INDEX_NAME = "collected_at_ttl"
+DUPLICATE_KEY_ERROR = 11000
+EXPORT_CHUNK_DAYS = 31
+
+
+class WeatherArchive:
+    def __init__(self, collection=None, retention_days: int = WEATHER_ARCHIVE_RETENTION_DAYS):
+        """
+        :param collection: The archive collection. Defaults to `weather_archive` in the shared database.
+        :param retention_days: Days a forecast is kept, 0 keeps everything.
+        :type retention_days: int
+        """
+        self.collection = collection if collection is not None else get_collection(WEATHER_ARCHIVE_COLLECTION)
+        self.retention_days = retention_days
+        self._indexed = False
+
+    def ensure_indexes(self) -> None:
+        """
+        Creates the unique (region, collected_at, datetime) key, the index for range
+        queries by target hour and, with a retention period, the TTL index.
+        """
+        if self._indexed:
+            return
+        self.collection.create_index([
+            ("region", pymongo.ASCENDING),
+            ("collected_at", pymongo.ASCENDING),
+            ("datetime", pymongo.ASCENDING)
+        ], unique=True)
+        self.collection.create_index([
+            ("datetime", pymongo.ASCENDING),
+            ("region", pymongo.ASCENDING)
+        ])
+
+        if self.retention_days > 0:
+            expire_after = self.retention_days * 24 * 3600
+            try:
+                self.collection.create_index("collected_at", name=TTL_INDEX_NAME, expireAfterSeconds=expire_after)
+            except OperationFailure:
+                # The TTL index exists with another retention period
+                self.collection.database.command(
+                    "collMod", self.collection.name,
+                    index={"name": TTL_INDEX_NAME, "expireAfterSeconds": expire_after}
+                )
+        self._indexed = True
+
+    def append(self, documents: list) -> int:
+        """
+        Archives weather documents. Rows that are already archived are skipped, so
+        appending the same run twice is harmless.
+
+        :param documents: Documents returned by `get_weather.get_hourly_weather_data`.
+        :type documents: list
+        :return: The number of inserted rows.
+        :rtype: int
+        """
+        rows = flatten_weather(documents)
+        if not rows:
+            return 0
+        self.ensure_indexes()
+        try:
+            return len(self.collection.insert_many(rows, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+            return e.details.get("nInserted", 0)
+
+    def query(self, start: dt.datetime, end: dt.datetime, regions: list = None,
+              collected_from: dt.datetime = None, collected_to: dt.datetime = None,
+              latest_only: bool = False) -> pd.DataFrame:
+        """
+        Reads the archived forecasts for target hours in [start, end).
+
+        :param start: First target hour, inclusive.
+        :type start: datetime.datetime
+        :param end: Last target hour, exclusive.
+        :type end: datetime.datetime
+        :param regions: Ukrainian region names to read, all regions when None.
+        :type regions: list
+        :param collected_from: Only forecasts collected at or after this time.
+        :type collected_from: datetime.datetime
+        :param collected_to: Only forecasts collected before this time.
+        :type collected_to: datetime.datetime
+        :param latest_only: Keep only the most recently collected forecast of every
+            region and target hour.
+        :type latest_only: bool
+        :return: A typed DataFrame with the `WEATHER_DTYPES` columns and `collected_at`,
+            sorted by target hour, region and collection time.
+        :rtype: pandas.DataFrame
+        """
+        query = {"datetime": {"$gte": start, "$lt": end}}
+        if regions is not None:
+            query["region"] = {"$in": list(regions)}
+        if collected_from is not None or collected_to is not None:
+            query["collected_at"] = {}
+            if collected_from is not None:
+                query["collected_at"]["$gte"] = collected_from
+            if collected_to is not None:
+                query["collected_at"]["$lt"] = collected_to
+
+        columns = list(ARCHIVE_DTYPES)
+        cursor = self.collection.find(
+            query, {"_id": 0, **{column: 1 for column in columns}}, batch_size=10000
+        ).sort([("datetime", pymongo.ASCENDING), ("region", pymongo.ASCENDING), ("collected_at", pymongo.ASCENDING)])
+        df = pd.DataFrame.from_records(cursor, columns=columns).astype(ARCHIVE_DTYPES)
+
+        if latest_only:
+            df = df.drop_duplicates(["datetime", "region"], keep="last").reset_index(drop=True)
+        return df
+
+    def export_parquet(self, path: str, start: dt.datetime, end: dt.datetime, regions: list = None,
+                       chunk_days: int = EXPORT_CHUNK_DAYS) -> int:
+        """
+        Exports the archived forecasts for target hours in [start, end) into a single
+        zstd-compressed Parquet file. The range is read in chunks of `chunk_days` days,
+        so only one chunk is held in memory at a time. Requires `pyarrow`.
+
+        :param path: Output file.
+        :type path: str
+        :param start: First target hour, inclusive.
+        :type start: datetime.datetime
+        :param end: Last target hour, exclusive.
+        :type end: datetime.datetime
+        :param regions: Ukrainian region names to export, all regions when None.
+        :type regions: list
+        :param chunk_days: Days of target hours read per chunk.
+        :type chunk_days: int
+        :raises RuntimeError: If pyarrow is not installed.
+        :return: The number of exported rows.
+        :rtype: int
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow, install it with `pip install pyarrow`")
+
+        schema = pa.Schema.from_pandas(self.query(start, start, regions), preserve_index=False)
+        exported = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+            chunk_start = start
+            while chunk_start < end:
+                chunk_end = min(chunk_start + dt.timedelta(days=chunk_days), end)
+                df = self.query(chunk_start, chunk_end, regions)
+                if len(df):
+                    writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+                    exported += len(df)
+                chunk_start = chunk_end
+        return exported
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export archived weather forecasts to Parquet")
+    parser.add_argument("--start", required=True, type=dt.datetime.fromisoformat, help="First target hour (ISO format)")
+    parser.add_argument("--end", required=True, type=dt.datetime.fromisoformat, help="End of the range, exclusive (ISO format)")
+    parser.add_argument("--region", action="append", dest="regions", help="Region to export, repeatable (default: all)")
+    parser.add_argument("--output", default="prepared_data/weather_archive.parquet", help="Output Parquet file")
+    args = parser.parse_args(argv)
+
+    try:
+        exported = WeatherArchive().export_parquet(args.output, args.start, args.end, args.regions)
+        print(f"Exported {exported} forecast rows to {args.output}")
+    except Exception as e:
+        print(f"Export error: {str(e)}")
+
+
+if __name__ == "__main__":
+    main()
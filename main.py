@@ -1,32 +1,46 @@
 from get_data.isw import last_isw
 from get_data.weather import get_weather
+from apscheduler.schedulers.blocking import BlockingScheduler
+from contextlib import contextmanager
+from datetime import datetime
+from common.mongo import get_collection
+from common.model_registry import registry
+from common.prediction_cache import bump_generation
+from common.compiled_forest import compiled_path
+import numpy as np
 import pandas as pd
 import pymongo
-import pickle
+import argparse
+import os
+import time
+
+MODEL_PATH = "models/RandomForestClassifier_model.pkl"
+# "compiled" predicts with the forest exported by `python -m common.compiled_forest` (and by
+# train.py). It loads in milliseconds, predicts single hours several times faster than sklearn
+# and the full 24 regions x 24 hours batch (576 rows) about 20% faster
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "sklearn")
+PREDICTION_COLLECTION = "prediction"
+DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
 
 
 def load_weather_data():
     """
-    Loads weather data from a MongoDB collection and converts it into a pandas DataFrame.
+    Loads the flat hourly weather rows from MongoDB into a typed pandas DataFrame.
+    The server projects only the model columns and the rows are read straight into
+    columns, without touching every hour in Python.
 
     :raises RuntimeError: If there is an issue connecting to MongoDB or retrieving the data.
     :return: A pandas DataFrame containing the hourly forecast data with associated regions.
     :rtype: pandas.DataFrame
     """
     try:
-        client = pymongo.MongoClient("mongodb://localhost:27017")
-        db = client["PythonForDs"]
-        collection = db["weather"]
-        documents = collection.find()
-
-        hourly_data = []
-        for doc in documents:
-            region = doc.get("region", "Unknown")
-            for hour in doc.get("hourly_forecast", []):
-                hour["region"] = region
-                hourly_data.append(hour)
+        columns = list(get_weather.WEATHER_DTYPES)
+        cursor = get_collection(get_weather.WEATHER_COLLECTION).aggregate([
+            {"$sort": {"region": 1, "datetime": 1}},
+            {"$project": {"_id": 0, **{column: 1 for column in columns}}}
+        ])
 
-        return pd.DataFrame(hourly_data)
+        return pd.DataFrame.from_records(cursor, columns=columns).astype(get_weather.WEATHER_DTYPES)
 
     except Exception as e:
         raise RuntimeError(f"Failed to load weather data: {e}")
@@ -43,87 +57,348 @@ def preprocess_data(df: pd.DataFrame, isw_df: pd.DataFrame) -> pd.DataFrame:
     :return:
         A pandas DataFrame that combines the processed `df` DataFrame with `isw_df`.
     """
+    df = df.reset_index(drop=True)
     df["datetime"] = pd.to_datetime(df["datetime"])
-    df["hour_preciptype"] = df["hour_preciptype"].fillna("none").astype(str)
-    df["hour_preciptype"] = df["hour_preciptype"].apply(
-        lambda x: " ".join(x.strip("[]").replace("'", "").replace(" ", "").split(","))
+    df["hour_preciptype"] = (
+        df["hour_preciptype"].fillna("none").astype(str)
+        .str.strip("[]")
+        .str.replace("'", "", regex=False)
+        .str.replace(" ", "", regex=False)
+        .str.replace(",", " ", regex=False)
     )
 
-    isw_expanded = pd.concat([isw_df] * len(df), ignore_index=True)
-    df_combined = pd.concat([df.reset_index(drop=True), isw_expanded], axis=1)
+    # Broadcast the single ISW row as a read-only view instead of copying it once per weather row
+    isw_values = np.broadcast_to(isw_df.to_numpy()[:1], (len(df), isw_df.shape[1]))
+    isw_expanded = pd.DataFrame(isw_values, columns=isw_df.columns, index=df.index, copy=False)
+    df_combined = pd.concat([df, isw_expanded], axis=1, copy=False)
 
     return df_combined
 
 
+def active_model_path() -> str:
+    """
+    :return: The pickled pipeline, or its compiled forest when `MODEL_BACKEND` is "compiled".
+        The pipeline is used when the compiled forest is missing or older than it.
+    :rtype: str
+    """
+    if MODEL_BACKEND != "compiled":
+        return MODEL_PATH
+    npz_path = compiled_path(MODEL_PATH)
+    if not os.path.exists(npz_path) or (
+            os.path.exists(MODEL_PATH) and os.path.getmtime(MODEL_PATH) > os.path.getmtime(npz_path)):
+        print(f"Warning: {npz_path} is missing or older than {MODEL_PATH}, predicting with the pickled pipeline. "
+              f"Run `python -m common.compiled_forest {MODEL_PATH}` to re-export it.")
+        return MODEL_PATH
+    return npz_path
+
+
 def load_model(path: str):
     """
-    Loads a model from a file.
+    Loads a model from a file. The model is unpickled once per process and reloaded
+    only when the file changes.
+    """
+    return registry.get(path)
+
+
+def build_prediction_documents(results_df: pd.DataFrame) -> list:
+    """
+    Groups hourly predictions into one document per region.
+
+    :param results_df: A DataFrame with `datetime`, `region` and `predictions` columns and
+        an optional `fingerprint` column, stored as the `fingerprints` list of the region.
+    :return: A list of documents with the region name and its hourly predictions sorted by time.
+    :rtype: list
+    """
+    df = results_df.sort_values(["region", "datetime"], kind="stable")
+    regions = df["region"].to_numpy()
+    datetimes = df["datetime"].dt.strftime(DATETIME_FORMAT).tolist()
+    predictions = df["predictions"].astype(int).tolist()
+    fingerprints = df["fingerprint"].astype(np.int64).tolist() if "fingerprint" in df else None
+
+    if not len(df):
+        return []
+
+    boundaries = [0, *(np.flatnonzero(regions[1:] != regions[:-1]) + 1), len(df)]
+    documents = []
+    for start, end in zip(boundaries[:-1], boundaries[1:]):
+        document = {
+            "region": regions[start],
+            "hourly_predictions": [
+                {"datetime": d, "prediction": p}
+                for d, p in zip(datetimes[start:end], predictions[start:end])
+            ]
+        }
+        if fingerprints is not None:
+            document["fingerprints"] = fingerprints[start:end]
+        documents.append(document)
+    return documents
+
+
+def fingerprint_rows(X: pd.DataFrame, salt: str = "") -> np.ndarray:
+    """
+    Hashes every feature row, so a region-hour whose weather and ISW values are the same
+    as in the previous cycle keeps its stored prediction.
+
+    :param X: The model input.
+    :param salt: Hex digest of the model, a new model changes every fingerprint.
+    :type salt: str
+    :return: One int64 fingerprint per row.
+    :rtype: numpy.ndarray
+    """
+    hashes = pd.util.hash_pandas_object(X, index=False).to_numpy(dtype=np.uint64)
+    if salt:
+        hashes = hashes ^ np.uint64(int(salt[:16], 16))
+    return hashes.view(np.int64)
+
+
+def load_stored_predictions(collection) -> dict:
+    """
+    :param collection: The MongoDB collection that stores predictions.
+    :return: The stored prediction documents by region.
+    :rtype: dict
+    """
+    return {doc["region"]: doc for doc in collection.find({}, {"_id": 0})}
+
+
+def match_stored_predictions(regions, datetimes, fingerprints, stored: dict) -> np.ndarray:
+    """
+    Looks up the stored prediction of every region-hour whose fingerprint is unchanged.
+
+    :param regions: Region of every row.
+    :param datetimes: Hour of every row.
+    :param fingerprints: Fingerprint of every row, see `fingerprint_rows`.
+    :param stored: Stored prediction documents by region.
+    :type stored: dict
+    :return: The stored predictions aligned with the rows, NaN for rows that have to be predicted.
+    :rtype: numpy.ndarray
+    """
+    stored_df = pd.DataFrame.from_records(
+        ((region, hour["datetime"], fingerprint, hour["prediction"])
+         for region, doc in stored.items()
+         for hour, fingerprint in zip(doc.get("hourly_predictions", []), doc.get("fingerprints") or [])),
+        columns=["region", "datetime", "fingerprint", "prediction"]
+    ).drop_duplicates(["region", "datetime", "fingerprint"])
+    current = pd.DataFrame({
+        "region": np.asarray(regions, dtype=object),
+        "datetime": pd.to_datetime(pd.Series(datetimes)).dt.strftime(DATETIME_FORMAT).to_numpy(dtype=object),
+        "fingerprint": np.asarray(fingerprints, dtype=np.int64),
+    })
+    stored_df = stored_df.astype({"region": object, "datetime": object, "fingerprint": np.int64})
+    merged = current.merge(stored_df, on=["region", "datetime", "fingerprint"], how="left")
+    return merged["prediction"].to_numpy(dtype=float)
+
+
+def prediction_write(document: dict, stored_doc: dict = None):
+    """
+    Returns the write that turns the stored document of a region into `document`:
+    nothing when it is unchanged, a `$push` with `$slice` when the 24-hour window only
+    moved forward, and a full replacement otherwise.
+
+    :param document: The new region document.
+    :type document: dict
+    :param stored_doc: The stored region document, None if there is none.
+    :type stored_doc: dict
+    :return: A pymongo write operation, or None.
+    """
+    region = document["region"]
+    replace = pymongo.ReplaceOne({"region": region}, document, upsert=True)
+    if stored_doc is None or "fingerprints" not in document or not stored_doc.get("fingerprints"):
+        return replace
+
+    old = list(zip(stored_doc.get("hourly_predictions", []), stored_doc["fingerprints"]))
+    new = list(zip(document["hourly_predictions"], document["fingerprints"]))
+    if old == new:
+        return None
+
+    first = new[0][0]["datetime"]
+    kept = [entry for entry in old if entry[0]["datetime"] >= first]
+    if not kept or new[:len(kept)] != kept:
+        return replace
+
+    appended = new[len(kept):]
+    return pymongo.UpdateOne({"region": region}, {"$push": {
+        "hourly_predictions": {"$each": [hour for hour, _ in appended], "$slice": -len(new)},
+        "fingerprints": {"$each": [fingerprint for _, fingerprint in appended], "$slice": -len(new)},
+    }})
+
+
+def save_predictions(results_df: pd.DataFrame, collection, stored: dict = None) -> int:
+    """
+    Replaces the stored predictions with a single unordered bulk write. Every region
+    document is replaced in place and regions missing from the new batch are removed,
+    so readers never see an empty collection. An empty batch leaves the collection untouched.
+    With the stored documents at hand, unchanged regions are skipped and regions whose
+    window only moved forward get the new hours appended instead of a full replacement.
+
+    :param results_df: A DataFrame with `datetime`, `region` and `predictions` columns.
+    :param collection: The MongoDB collection that stores predictions.
+    :param stored: The stored prediction documents by region, see `load_stored_predictions`.
+    :type stored: dict
+    :return: The number of write operations sent.
+    :rtype: int
+    """
+    documents = build_prediction_documents(results_df)
+    if not documents:
+        return 0
+
+    regions = [doc["region"] for doc in documents]
+    if stored is None:
+        operations = [pymongo.ReplaceOne({"region": doc["region"]}, doc, upsert=True) for doc in documents]
+        operations.append(pymongo.DeleteMany({"region": {"$nin": regions}}))
+    else:
+        operations = [op for op in (prediction_write(doc, stored.get(doc["region"])) for doc in documents) if op]
+        if set(stored) - set(regions):
+            operations.append(pymongo.DeleteMany({"region": {"$nin": regions}}))
+    if not operations:
+        return 0
+
+    collection.create_index([
+        ("region", pymongo.ASCENDING)
+    ], unique=True)
+    collection.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+def get_feature_columns(model) -> list:
+    """
+    Returns the input columns the fitted model pipeline was trained on, in training order.
+
+    :param model: The fitted model pipeline.
+    :return: A list of column names, empty if the model was not fitted on a DataFrame.
+    :rtype: list
     """
-    with open(path, "rb") as f:
-        return pickle.load(f)
+    return list(getattr(model, "feature_names_in_", []))
+
+
+@contextmanager
+def timed_stage(name: str, timings: dict):
+    """
+    Measures the wall-clock time of a pipeline stage and stores it in `timings`.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - started
+
+
+def format_timings(timings: dict) -> str:
+    stages = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+    return f"Cycle finished in {sum(timings.values()):.2f}s ({stages})"
 
 
 def main():
+    """
+    Runs one prediction cycle: updates weather and ISW data, predicts the next 24 hours
+    for every region and stores the results in MongoDB. Region-hours whose feature row
+    and model are unchanged since the last cycle reuse the stored prediction, and only
+    the regions whose predictions changed are written.
+
+    :return: Wall-clock duration of every stage in seconds.
+    :rtype: dict
+    """
+    timings = {}
+
     # Step 1: Update weather & ISW data
-    get_weather.main()
-    isw_df = last_isw.main()
+    with timed_stage("weather", timings):
+        get_weather.main()
+    with timed_stage("model", timings):
+        model_path = active_model_path()
+        model = load_model(model_path)
+        feature_columns = registry.derived(model_path, "feature_columns", get_feature_columns)
+    with timed_stage("isw", timings):
+        isw_df = last_isw.main(feature_columns or None)
 
     # Step 2: Load and prepare data
-    df_weather = load_weather_data()
-    df_processed = preprocess_data(df_weather, isw_df)
+    with timed_stage("prepare", timings):
+        df_weather = load_weather_data()
+        df_processed = preprocess_data(df_weather, isw_df)
 
-    # Step 3: Extract useful columns
-    datetime_col = df_processed["datetime"]
-    region_col = df_processed["region"]
-    X = df_processed.drop(columns=["datetime"])
-    X["region"] = "None" #It would be better to retrain the model, but due to the time required, we opted for this approach instead
+        # Step 3: Extract useful columns
+        datetime_col = df_processed["datetime"]
+        region_col = df_processed["region"]
+        if feature_columns:
+            X = df_processed[feature_columns]
+        else:
+            X = df_processed.drop(columns=["datetime"])
+        X = X.assign(region="None") #It would be better to retrain the model, but due to the time required, we opted for this approach instead
 
-    # Step 4: Predict
-    model = load_model("models/RandomForestClassifier_model.pkl")
-    predictions = model.predict(X)
+    # Step 4: Predict the region-hours whose inputs changed
+    with timed_stage("predict", timings):
+        collection = get_collection(PREDICTION_COLLECTION)
+        fingerprints = fingerprint_rows(X, registry.digest(model_path))
+        try:
+            stored = load_stored_predictions(collection)
+        except Exception as e:
+            print(f"Failed to load stored predictions, predicting every region-hour: {e}")
+            stored = None
+        predictions = match_stored_predictions(region_col, datetime_col, fingerprints, stored or {})
+        changed = np.isnan(predictions)
+        if changed.any():
+            predictions[changed] = model.predict(X[changed])
 
     # Step 5: Save results
     results_df = pd.DataFrame({
         "datetime": datetime_col,
         "region": region_col,
-        "predictions": predictions
+        "predictions": predictions.astype(int),
+        "fingerprint": fingerprints
     })
 
     # Step 6: Save to MongoDB
-    try:
-        client = pymongo.MongoClient("mongodb://localhost:27017")
-        db = client["PythonForDs"]
-        prediction_collection = db["prediction"]
-        prediction_collection.delete_many({})
-        prediction_collection.create_index([
-            ("region", pymongo.ASCENDING)
-        ], unique=True)
-
-        for region, region_group in results_df.groupby("region"):
-            region_group = region_group.sort_values("datetime")
-
-            hourly_predictions = []
-            for _, row in region_group.iterrows():
-                hourly_predictions.append({
-                    "datetime": row["datetime"].isoformat(),
-                    "prediction": int(row["predictions"])
-                })
-            prediction_data = {
-                "region": region,
-                "hourly_predictions": hourly_predictions,
-            }
-
-            prediction_collection.update_one(
-                {"region": region},
-                {"$set": prediction_data},
-                upsert=True
-            )
-    except Exception as db_error:
-        raise RuntimeError(f"Failed to save predictions to MongoDB: {db_error}")
+    with timed_stage("store", timings):
+        try:
+            if save_predictions(results_df, collection, stored):
+                bump_generation()
+        except Exception as db_error:
+            raise RuntimeError(f"Failed to save predictions to MongoDB: {db_error}")
 
+    return timings
 
-if __name__ == "__main__":
+
+def run_cycle() -> None:
     try:
-        main()
+        print(format_timings(main()))
     except Exception as e:
         print(f"Error occurred: {e}")
+
+
+def run_scheduler(minute: int = 0) -> None:
+    """
+    Keeps the process resident and runs a prediction cycle right away and then every hour
+    at the given minute. Models, NLTK resources and MongoDB connections stay loaded
+    between cycles.
+
+    :param minute: Minute of the hour at which cycles start.
+    :type minute: int
+    """
+    try:
+        last_isw.warm_up()
+        load_model(active_model_path())
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+
+    scheduler = BlockingScheduler()
+    scheduler.add_job(run_cycle, "cron", minute=minute, next_run_time=datetime.now(),
+                      max_instances=1, coalesce=True)
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="War event prediction pipeline")
+    parser.add_argument("--once", action="store_true",
+                        help="Run a single prediction cycle and exit (for cron)")
+    parser.add_argument("--minute", type=int, default=0, choices=range(60), metavar="[0-59]",
+                        help="Minute of every hour at which the resident scheduler runs (default: 0)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.once:
+        run_cycle()
+    else:
+        run_scheduler(args.minute)
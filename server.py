@@ -1,18 +1,19 @@
 from flask import Flask, request, jsonify, render_template
-import pymongo
 import os
 import requests
-import pandas as pd
 from dotenv import load_dotenv
 from datetime import datetime
 from flask_cors import CORS
 from get_data.alerts.get_active_alerts import main as get_alerts
+from common.mongo import get_collection
+from common.prediction_cache import PredictionCache
+from common.regions import region_by_city_en
 
-regions = pd.read_csv("data/regions.csv")
 load_dotenv()
 API_TOKEN = os.getenv("API_TOKEN")
 app = Flask(__name__)
 CORS(app)
+prediction_cache = PredictionCache()
 
 
 class InvalidUsage(Exception):
@@ -43,27 +44,35 @@ def get_prediction():
         raise InvalidUsage("Invalid API token", status_code=403)
     region = json_data.get("region")
 
-    client = pymongo.MongoClient("mongodb://localhost:27017")
-    db = client["PythonForDs"]
-    collection = db["prediction"]
     predict_time = datetime.utcnow().replace(minute=0, second=0, microsecond=0).strftime("%Y-%m-%dT%H:%M:%SZ")
+    body = prediction_cache.get_or_build((region or None, predict_time),
+                                         lambda: build_prediction_body(region, predict_time))
+    if body is None:
+        raise InvalidUsage("No prediction found for region", status_code=404)
+    return app.response_class(body, mimetype=app.json.mimetype)
+
+
+def build_prediction_body(region, predict_time):
+    """
+    Reads predictions from MongoDB and serializes the /predict response.
+
+    :param region: Region name, or an empty value for all regions.
+    :param predict_time: Timestamp reported as `last_prediction_time`.
+    :return: The serialized JSON body, or None if the region has no prediction.
+    :rtype: bytes
+    """
+    collection = get_collection("prediction")
     if region:
-        result = collection.find_one({"region": region})
-        if result:
-            result.pop("_id", None)
-            hourly_predictions = result.get("hourly_predictions", [])
-            response_data = {
-                "last_prediction_time": predict_time,
-                result.get("region", "Unknown"): hourly_predictions
-            }
-            return jsonify(response_data)
-        else:
-            raise InvalidUsage("No prediction found for region", status_code=404)
+        result = collection.find_one({"region": region}, {"_id": 0, "fingerprints": 0})
+        if not result:
+            return None
+        response_data = {
+            "last_prediction_time": predict_time,
+            result.get("region", "Unknown"): result.get("hourly_predictions", [])
+        }
     else:
-        results = collection.find()
         forecasts = []
-        for r in results:
-            r.pop("_id", None)
+        for r in collection.find({}, {"_id": 0, "fingerprints": 0}):
             forecasts.append({
                 r.get("region", "Unknown"): r.get("hourly_predictions", [])
             })
@@ -72,7 +81,7 @@ def get_prediction():
             "last_prediction_time": predict_time,
             "regions_forecast": forecasts
         }
-        return jsonify(response_data)
+    return app.json.response(response_data).get_data()
 
 
 @app.route("/alarms", methods=["POST", "GET", "OPTIONS"])
@@ -93,7 +102,7 @@ def get_region_from_ip():
 
         location = data.get("region")
         if location != "Kyiv":
-            return regions.loc[regions["center_city_en"] == location, "region"].values[0]
+            return region_by_city_en(location).name
         return "Київ"
     except Exception as e:
         return f"Error: {e}"
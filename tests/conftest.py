@@ -0,0 +1,20 @@
+import pytest
+
+
+@pytest.fixture
+def mongomock_bulk(monkeypatch):
+    """
+    Lets mongomock run `bulk_write` with the UpdateOne and ReplaceOne operations of
+    pymongo 4.9+, which pass a `sort` argument mongomock does not know yet.
+    """
+    from mongomock.collection import BulkOperationBuilder
+
+    def without_sort(method):
+        def wrapper(self, *args, sort=None, **kwargs):
+            if sort is not None:
+                raise NotImplementedError("mongomock does not support sorted bulk updates")
+            return method(self, *args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(BulkOperationBuilder, "add_update", without_sort(BulkOperationBuilder.add_update))
+    monkeypatch.setattr(BulkOperationBuilder, "add_replace", without_sort(BulkOperationBuilder.add_replace))
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import mongomock
+import numpy as np
+import pandas as pd
+
+from get_data.alerts.alarm_history import AlarmHistoryRecorder, AlarmIndex
+
+
+def at(hour, minute=0):
+    return datetime(2025, 3, 1) + timedelta(hours=hour, minutes=minute)
+
+
+def test_snapshots_become_intervals():
+    collection = mongomock.MongoClient()["db"]["alarm_history"]
+    recorder = AlarmHistoryRecorder(collection)
+
+    assert recorder.record(["Київ", "Львівська"], at(1)) == (["Київ", "Львівська"], [])
+    assert recorder.record(["Київ", "Львівська"], at(1, 1)) == ([], [])
+    assert recorder.record(["Львівська"], at(2, 30)) == ([], ["Київ"])
+    assert AlarmHistoryRecorder(collection).record([], at(3)) == ([], ["Львівська"])
+
+    intervals = sorted((d["region"], d["start"], d["end"]) for d in collection.find())
+    assert intervals == [("Київ", at(1), at(2, 30)), ("Львівська", at(1), at(3))]
+
+
+def test_index_labels_hours_overlapping_an_alarm():
+    index = AlarmIndex([
+        ("Київ", at(1, 30), at(2, 10)),
+        ("Київ", at(2, 0), at(3, 0)),
+        ("Львівська", at(5), None),
+    ], now=at(7, 15))
+
+    assert [index.is_active("Київ", at(h)) for h in range(5)] == [False, True, True, False, False]
+    assert index.is_active("Львівська", at(7)) and not index.is_active("Львівська", at(8))
+    assert not index.is_active("Одеська", at(1))
+
+    labels = index.label_range(at(0), at(8), ["Київ", "Львівська", "Одеська"])
+    assert labels.groupby("region")["is_alarm"].sum().to_dict() == {"Київ": 2, "Львівська": 3, "Одеська": 0}
+    kyiv = labels[labels["region"].eq("Київ") & labels["is_alarm"].eq(1)]
+    start, end = (pd.Timestamp(t, tz="UTC").timestamp() for t in (at(1, 30), at(3)))
+    assert kyiv["alarms_start_epoch"].tolist() == [start, start]
+    assert kyiv["alarms_end_epoch"].tolist() == [end, end]
+
+
+def test_vectorized_labels_match_point_queries():
+    rng = np.random.default_rng(0)
+    regions = ["Київ", "Львівська", "Одеська", "Сумська"]
+    intervals = []
+    for region in regions:
+        starts = np.sort(rng.integers(0, 24 * 30 * 60, size=40))
+        intervals += [(region, at(0, int(s)), at(0, int(s + rng.integers(5, 300)))) for s in starts]
+    index = AlarmIndex(intervals, now=at(24 * 31))
+
+    rows = pd.DataFrame({
+        "region": rng.choice(regions + ["Херсонська"], size=2000),
+        "hour": [at(int(h)) for h in rng.integers(0, 24 * 30, size=2000)],
+    })
+    labels = index.label(rows["region"], rows["hour"])
+
+    expected = [index.is_active(r, h) for r, h in zip(rows["region"], rows["hour"])]
+    assert labels["is_alarm"].astype(bool).tolist() == expected
@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+
+from common import compiled_forest
+from common.compiled_forest import CompiledForest, compiled_path
+from common.model_registry import ModelRegistry
+from train_models.train import pipeline_model
+
+
+def make_frame(n, seed):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.normal(size=(n, 4)), columns=["hour_temp", "hour_humidity", "air defense", "attack near"])
+    df["hour_conditions"] = rng.choice(["Clear", "Rain", "Overcast"], n)
+    df["region"] = rng.choice(["Київ", "Львівська"], n)
+    df["hour_preciptype"] = rng.choice(["none", "rain"], n)
+    df.loc[rng.random(n) < 0.05, "hour_humidity"] = np.nan
+    return df
+
+
+def test_compiled_pipeline_matches_predict(tmp_path, monkeypatch):
+    # Several blocks of trees per batch
+    monkeypatch.setattr(compiled_forest, "BLOCK_CELLS", 1000)
+    X = make_frame(600, 0)
+    y = ((X["hour_temp"] + X["air defense"] * X["attack near"]) > 0).astype(int)
+    model = pipeline_model(RandomForestClassifier, ["hour_temp", "hour_humidity", "air defense", "attack near"])
+    model.set_params(model__n_estimators=15, model__random_state=0).fit(X, y)
+    path = CompiledForest.export(model, compiled_path(str(tmp_path / "model.pkl")))
+
+    new = make_frame(300, 1).assign(region="None")
+    mapped = CompiledForest.load(path)
+    assert all(array.ctypes.data % compiled_forest.ALIGNMENT == 0 for array in (mapped.nodes, mapped.value))
+    for compiled in (CompiledForest.load(path), CompiledForest.load(path, mmap=False)):
+        np.testing.assert_array_equal(compiled.predict(new), model.predict(new))
+        np.testing.assert_array_equal(compiled.predict_proba(new), model.predict_proba(new))
+
+    loaded = ModelRegistry().get(path)
+    assert isinstance(loaded, CompiledForest)
+    assert list(loaded.feature_names_in_) == list(X.columns)
+
+
+def test_inputs_at_the_thresholds_take_the_same_branch(tmp_path):
+    rng = np.random.default_rng(2)
+    X = rng.normal(size=(400, 3))
+    y = (X[:, 0] * X[:, 1] > X[:, 2]).astype(int)
+    forest = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)
+    compiled = CompiledForest.load(CompiledForest.export(forest, str(tmp_path / "forest.npz")))
+
+    thresholds = np.concatenate([e.tree_.threshold[e.tree_.feature >= 0] for e in forest.estimators_])
+    edges = np.concatenate([
+        thresholds.astype(np.float32),
+        np.nextafter(thresholds.astype(np.float32), np.float32(np.inf)),
+        np.nextafter(thresholds.astype(np.float32), np.float32(-np.inf)),
+    ])
+    edge_rows = np.column_stack([edges, np.roll(edges, 1), np.roll(edges, 2)]).astype(np.float32)
+
+    np.testing.assert_array_equal(compiled.predict_proba(edge_rows), forest.predict_proba(edge_rows))
+
+
+def shuffled_tree(tree, rng):
+    """
+    The same tree with its nodes renumbered at random, the root kept first.
+    """
+    new_id = np.concatenate([[0], rng.permutation(np.arange(1, tree.node_count))])
+    order = np.argsort(new_id)
+
+    def child(children):
+        return np.where(children[order] == -1, -1, new_id[children[order]])
+
+    return SimpleNamespace(
+        children_left=child(tree.children_left), children_right=child(tree.children_right),
+        feature=tree.feature[order], threshold=tree.threshold[order], value=tree.value[order],
+        missing_go_to_left=tree.missing_go_to_left[order], node_count=tree.node_count, max_depth=tree.max_depth,
+    )
+
+
+def test_renumbered_trees_in_wide_records(tmp_path, monkeypatch):
+    rng = np.random.default_rng(3)
+    X = rng.normal(size=(500, 4)).astype(np.float32)
+    X[rng.random(X.shape) < 0.05] = np.nan
+    y = (np.nan_to_num(X[:, 0]) * np.nan_to_num(X[:, 1]) > np.nan_to_num(X[:, 2])).astype(int)
+    forest = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)
+    shuffled = SimpleNamespace(
+        estimators_=[SimpleNamespace(tree_=shuffled_tree(e.tree_, rng)) for e in forest.estimators_],
+        n_outputs_=1, n_features_in_=4, n_classes_=2, classes_=forest.classes_,
+    )
+    monkeypatch.setattr(compiled_forest, "NODE_DTYPE", compiled_forest.WIDE_NODE_DTYPE)
+    compiled = CompiledForest.load(CompiledForest.export(shuffled, str(tmp_path / "forest.npz")))
+
+    assert compiled.nodes.dtype == compiled_forest.WIDE_NODE_DTYPE
+    np.testing.assert_array_equal(compiled.predict_proba(X), forest.predict_proba(X))
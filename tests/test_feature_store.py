@@ -0,0 +1,54 @@
+import os
+from datetime import datetime
+
+import mongomock
+import numpy as np
+import pytest
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from get_data.isw import backfill_features, last_isw
+from get_data.isw.feature_store import IswFeatureStore
+
+
+def test_append_is_incremental(tmp_path):
+    store = IswFeatureStore(str(tmp_path / "features"))
+    names = ["air defense", "kursk oblast"]
+
+    assert store.append([datetime(2025, 3, 1), datetime(2025, 3, 2)],
+                        sparse.csr_matrix([[0.5, 0.0], [0.0, 1.0]]), names) == 2
+    assert store.append([datetime(2025, 3, 2), datetime(2025, 3, 3)],
+                        sparse.csr_matrix([[9.0, 9.0], [0.3, 0.4]]), names) == 1
+
+    # The second append wrote a new part and left the first one untouched
+    assert os.path.exists(store._part(1, "data"))
+    matrix, dates, stored_names = store.load()
+    np.testing.assert_array_equal(matrix.toarray(), [[0.5, 0.0], [0.0, 1.0], [0.3, 0.4]])
+    assert list(stored_names) == names
+    assert store.last_date() == datetime(2025, 3, 3)
+    np.testing.assert_array_equal(store.row_for(datetime(2025, 3, 2)).toarray(), [[0.0, 1.0]])
+    assert store.row_for(datetime(2025, 2, 28)) is None
+
+    with pytest.raises(ValueError):
+        store.append([datetime(2025, 3, 4)], sparse.csr_matrix([[1.0]]), ["other"])
+
+
+def test_backfill_vectorizes_only_new_reports(tmp_path, monkeypatch):
+    monkeypatch.setattr(last_isw, "get_stop_words", lambda: frozenset({"the"}))
+    monkeypatch.setattr(last_isw, "lemmatize", lambda word: word)
+    collection = mongomock.MongoClient()["PythonForDs"]["isw_report"]
+    texts = ["Russian forces attacked the city", "Ukrainian forces repelled attacks", "Air defense downed drones"]
+    collection.insert_many([
+        {"date": datetime(2025, 3, day), "extracted_text": text} for day, text in enumerate(texts, start=1)
+    ])
+    vectorizer = TfidfVectorizer().fit(last_isw.TextNormalizer().normalize_many(texts))
+    store = IswFeatureStore(str(tmp_path / "features"))
+
+    assert backfill_features.backfill(collection, store, vectorizer, chunk_size=2) == 3
+    assert len(os.listdir(store.path)) == 2 + 2 * 3  # index, names and a part per chunk
+    collection.insert_one({"date": datetime(2025, 3, 4), "extracted_text": "Russian drones attacked"})
+    assert backfill_features.backfill(collection, store, vectorizer) == 1
+
+    expected = vectorizer.transform([last_isw.TextNormalizer().normalize("Russian drones attacked")])
+    stored = last_isw.load_stored_features(datetime(2025, 3, 4), vectorizer, store)
+    np.testing.assert_allclose(stored.to_numpy(), expected.toarray())
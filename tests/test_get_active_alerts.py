@@ -0,0 +1,73 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from get_data.alerts import get_active_alerts
+from get_data.alerts.get_active_alerts import AlertsProvider
+
+
+class StubAlerts:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return ["Київ", "Харківська"]
+
+
+def test_concurrent_callers_share_one_upstream_call():
+    stub = StubAlerts(delay=0.1)
+    provider = AlertsProvider(stub, ttl=60)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: provider.get(), range(8)))
+
+    assert stub.calls == 1
+    assert all(result == ["Київ", "Харківська"] for result in results)
+
+
+def test_alerts_are_refetched_after_ttl():
+    stub = StubAlerts()
+    provider = AlertsProvider(stub, ttl=0.05)
+
+    provider.get()
+    provider.get()
+    time.sleep(0.06)
+    provider.get()
+
+    assert stub.calls == 2
+
+
+def test_failed_fetch_is_not_cached():
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("upstream down")
+        return []
+
+    provider = AlertsProvider(fetch, ttl=60)
+    with pytest.raises(RuntimeError):
+        provider.get()
+    assert provider.get() == []
+
+
+def test_alarms_endpoint_uses_shared_provider(monkeypatch):
+    from server import app
+
+    stub = StubAlerts()
+    monkeypatch.setattr(get_active_alerts, "_provider", AlertsProvider(stub, ttl=60))
+
+    with app.test_client() as client:
+        first = client.get("/alarms").get_json()
+        second = client.get("/alarms").get_json()
+
+    assert first == second == ["Київ", "Харківська"]
+    assert stub.calls == 1
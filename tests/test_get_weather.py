@@ -0,0 +1,179 @@
+import datetime as dt
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+os.environ.setdefault("API_TOKEN", "test_token")
+os.environ.setdefault("VISUAL_CROSSING_API_KEY", "test_key")
+
+from get_data.weather import get_weather
+from get_data.weather.forecast_cache import ForecastCache
+
+
+def make_payload():
+    today = dt.date.today()
+    days = []
+    for day in (today, today + dt.timedelta(days=1)):
+        days.append({
+            "datetime": day.isoformat(),
+            "tempmax": 10, "tempmin": 0, "temp": 5,
+            "hours": [{"datetime": f"{h:02d}:00:00", "temp": h} for h in range(24)]
+        })
+    return {"latitude": 50.45, "longitude": 30.52, "days": days}
+
+
+class StubWeatherServer:
+    def __init__(self, delay=0.0, failures=0, etag=None):
+        self.delay = delay
+        self.failures = failures
+        self.etag = etag
+        self.requests = 0
+        self.not_modified = 0
+        self.connections = set()
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with stub.lock:
+                    stub.connections.add(self.client_address)
+                    stub.requests += 1
+                    fail = stub.failures > 0
+                    if fail:
+                        stub.failures -= 1
+                time.sleep(stub.delay)
+                if stub.etag and self.headers.get("If-None-Match") == stub.etag:
+                    with stub.lock:
+                        stub.not_modified += 1
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                body = b"unavailable" if fail else json.dumps(make_payload()).encode()
+                self.send_response(503 if fail else 200)
+                self.send_header("Content-Type", "application/json")
+                if stub.etag:
+                    self.send_header("ETag", stub.etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/timeline"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    def start(**kwargs):
+        stub = StubWeatherServer(**kwargs)
+        monkeypatch.setattr(get_weather, "WEATHER_API_URL", stub.url)
+        return stub
+
+    return start
+
+
+def test_fetch_all_regions_runs_concurrently(stub_server):
+    with stub_server(delay=0.2) as stub:
+        started = time.perf_counter()
+        results = get_weather.fetch_all_regions(max_workers=len(get_weather.REGIONS))
+        elapsed = time.perf_counter() - started
+
+    assert len(results) == len(get_weather.REGIONS)
+    assert {r["region"] for r in results} == set(get_weather.REGIONS)
+    assert all(len(r["hourly_forecast"]) == 24 for r in results)
+    assert elapsed < 0.2 * len(get_weather.REGIONS) / 2
+
+
+def test_per_host_limit_caps_concurrency(stub_server):
+    with stub_server(delay=0.05) as stub:
+        session = get_weather.create_session(per_host_limit=3)
+        get_weather.fetch_all_regions(max_workers=12, session=session)
+        session.close()
+
+    assert len(stub.connections) <= 3
+
+
+def test_failed_requests_are_retried(stub_server):
+    with stub_server(failures=2) as stub:
+        session = get_weather.create_session(retries=3, backoff_factor=0.01)
+        results = get_weather.fetch_all_regions({"Львівська": "Lviv"}, session=session)
+        session.close()
+
+    assert stub.requests == 3
+    assert results[0]["region"] == "Львівська"
+
+
+def test_fresh_forecast_is_served_from_cache(stub_server, tmp_path):
+    with stub_server() as stub:
+        cache = ForecastCache(str(tmp_path))
+        first = get_weather.fetch_all_regions({"Львівська": "Lviv"}, cache=cache)
+        second = get_weather.fetch_all_regions({"Львівська": "Lviv"}, cache=ForecastCache(str(tmp_path)))
+
+    assert stub.requests == 1
+    assert second[0]["hourly_forecast"] == first[0]["hourly_forecast"]
+    # The cached forecast keeps its download time, the archive does not store it twice
+    assert second[0]["collected_at"] == first[0]["collected_at"]
+
+
+def test_stale_forecast_is_served_and_revalidated(stub_server):
+    with stub_server(etag='"v1"') as stub:
+        cache = ForecastCache(None, ttl=60, stale_ttl=60)
+        first = get_weather.fetch_all_regions({"Львівська": "Lviv"}, cache=cache)
+        cache.get("Lviv")["fetched_at"] -= 90
+
+        results = get_weather.fetch_all_regions({"Львівська": "Lviv"}, cache=cache)
+        cache.wait()
+        revalidated = get_weather.fetch_all_regions({"Львівська": "Lviv"}, cache=cache)
+
+    assert len(results[0]["hourly_forecast"]) == 24
+    assert (stub.requests, stub.not_modified) == (2, 1)
+    assert cache.state(cache.get("Lviv")) == "fresh"
+    # Not modified: still the forecast downloaded by the first run
+    assert revalidated[0]["collected_at"] == first[0]["collected_at"]
+
+
+def test_cached_payload_is_sliced_from_the_current_hour():
+    start = dt.datetime.combine(dt.date.today(), dt.time(5))
+    hours = get_weather.parse_hourly_forecast(make_payload(), "Львівська", start)
+
+    assert len(hours) == 24
+    assert hours[0]["datetime"] == f"{dt.date.today().isoformat()}T05:00:00"
+    assert hours[-1]["datetime"] == f"{(dt.date.today() + dt.timedelta(days=1)).isoformat()}T04:00:00"
+
+
+def test_save_weather_writes_one_row_per_region_hour():
+    from unittest import mock
+    import pymongo
+
+    collection = mock.Mock()
+    start = dt.datetime.combine(dt.date.today(), dt.time(5))
+    document = {
+        "region": "Львівська",
+        "collected_at": "2025-03-01T09:30:00+00:00",
+        "hourly_forecast": get_weather.parse_hourly_forecast(make_payload(), "Львівська", start)
+    }
+
+    get_weather.save_weather([document], collection)
+
+    operations = collection.bulk_write.call_args.args[0]
+    assert len(operations) == 25
+    assert operations[0]._filter == {"region": "Львівська", "datetime": start}
+    assert operations[0]._doc["hour_temp"] == 5.0
+    assert operations[-1] == pymongo.DeleteMany({"region": "Львівська", "datetime": {"$lt": start}})
@@ -0,0 +1,64 @@
+import pytest
+
+from get_data.isw import html_extractor
+
+REPORT_HTML = """
+<html><head><title>Report</title><script>var a = 1;</script></head>
+<body>
+<header><p>Site header ET</p></header>
+<nav><a href="/">Home</a></nav>
+<div class="sidebar"><p>Related content</p></div>
+<div class="content">
+  <h1>Russian Offensive Campaign Assessment, March 2, 2025</h1>
+  <p>Karolina Hird and George Barros</p>
+  <p>March 2, 2025, 5:30 pm ET</p>
+  <p>Click here to see ISW's interactive map.</p>
+  <h2>Key Takeaways</h2>
+  <p>Russian forces conducted ground attacks near Pokrovsk.[1]</p>
+  <script>track();</script>
+  <p>Note: ISW does not receive classified material.</p>
+  <p>Ukrainian forces   repelled assaults in Kursk Oblast.</p>
+</div>
+<footer><p>Footer</p></footer>
+</body></html>
+"""
+
+
+@pytest.mark.parametrize("parser", html_extractor.PARSERS)
+@pytest.mark.parametrize("selective", [False, True])
+def test_parser_backends_extract_the_same_text(parser, selective):
+    expected = html_extractor.extract_text_from_html(REPORT_HTML)
+
+    assert expected.startswith("Russian Offensive Campaign Assessment")
+    assert html_extractor.extract_text_from_html(REPORT_HTML, parser, selective) == expected
+
+
+def test_selective_parse_falls_back_to_body():
+    html = "<html><body><p>March 2 ET</p><p>Russian forces advanced.</p></body></html>"
+
+    assert html_extractor.extract_text_from_html(html, selective=True) == \
+        html_extractor.extract_text_from_html(html)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_process_documents_skips_processed_dates(workers):
+    from datetime import datetime
+    import mongomock
+    from common import mongo
+
+    uri = "mongodb://html-extractor-test:27017"
+    client = mongomock.MongoClient()
+    mongo.set_client(client, uri)
+    db = client["PythonForDs"]
+    db["isw_html"].insert_many([
+        {"date": datetime(2025, 3, day), "url": f"u{day}", "html_content": REPORT_HTML} for day in (1, 2, 3)
+    ])
+    db["isw_report"].insert_one({"date": datetime(2025, 3, 1), "extracted_text": "already processed"})
+
+    html_extractor.process_documents(uri, "PythonForDs", "isw_html", "isw_report", workers=workers, batch_size=2)
+
+    reports = {doc["date"].day: doc["extracted_text"] for doc in db["isw_report"].find()}
+    assert reports[1] == "already processed"
+    assert reports[2] == reports[3] == html_extractor.clean_extracted_text(
+        html_extractor.extract_text_from_html(REPORT_HTML)
+    )
@@ -0,0 +1,73 @@
+import threading
+import time
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import mongomock
+import pytest
+
+from get_data.isw import isw_data_scraper
+
+
+@pytest.fixture
+def report_server(monkeypatch):
+    connections = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            connections.append(self.client_address)
+
+        def do_GET(self):
+            preferred = self.path.endswith("russian-offensive-campaign-update-march-2-2025")
+            if preferred:
+                # answers after the less preferred variant below
+                time.sleep(0.2)
+            found = preferred or self.path.endswith("russian-offensive-campaign-assessment-march-2-2025-0")
+            body = b"<html>report</html>" if found else b"not found"
+            self.send_response(200 if found else 404)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(isw_data_scraper, "BASE_URL", f"http://127.0.0.1:{server.server_port}/")
+    monkeypatch.setattr(isw_data_scraper.time, "sleep", lambda seconds: None)
+    yield connections
+    server.shutdown()
+    server.server_close()
+
+
+def test_incremental_scrape_skips_stored_dates(report_server, mongomock_bulk):
+    client = mongomock.MongoClient()
+    collection = client["PythonForDs"]["isw_html"]
+    collection.insert_one({"date": datetime(2025, 3, 1), "url": "stored", "html_content": "<html></html>"})
+
+    with isw_data_scraper.ISWReportScraper(client, "PythonForDs", "isw_html") as scraper:
+        scraper.scrape_data(date(2025, 3, 1), date(2025, 3, 2), incremental=True)
+        # Scraping again upserts by URL instead of adding a duplicate
+        scraper.save_reports([(date(2025, 3, 2), scraper.generate_urls(date(2025, 3, 2))[6], "<html>new</html>")])
+
+    # The earlier URL pattern wins even though the later one answered first
+    assert list(collection.find({"date": datetime(2025, 3, 2)}, {"_id": 0})) == [{
+        "date": datetime(2025, 3, 2),
+        "url": isw_data_scraper.BASE_URL + "russian-offensive-campaign-update-march-2-2025",
+        "html_content": "<html>new</html>"
+    }]
+    assert collection.count_documents({}) == 2
+
+
+def test_rejected_probes_reuse_pooled_connections(report_server):
+    with isw_data_scraper.ISWReportScraper(mongomock.MongoClient(), "PythonForDs", "isw_html",
+                                           max_workers=2) as scraper:
+        for day in range(3, 6):
+            assert scraper.fetch_report(date(2025, 3, day)) is None
+
+    # 30 probes answered with 404 over at most one connection per worker
+    assert len(report_server) <= 2
@@ -0,0 +1,129 @@
+from datetime import datetime
+
+import mongomock
+import pandas as pd
+import pytest
+
+from common import mongo
+from get_data.isw import last_isw
+
+
+def page(text):
+    return f"<html><body><div class='content'><p>{text}</p></div></body></html>"
+
+
+@pytest.fixture
+def isw_db(monkeypatch):
+    client = mongomock.MongoClient()
+    mongo.set_client(client)
+    last_isw._latest_features.clear()
+    collection = client[mongo.MONGO_DATABASE]["isw_html"]
+    collection.insert_many([
+        {"date": datetime(2025, 3, 2), "url": "b", "html_content": page("second")},
+        {"date": datetime(2025, 3, 1), "url": "a", "html_content": page("first")},
+    ])
+    yield collection
+    mongo.close_clients()
+    last_isw._latest_features.clear()
+
+
+def test_latest_report_is_selected_by_date(isw_db):
+    assert last_isw.get_latest_isw_date() == datetime(2025, 3, 2)
+    assert last_isw.get_latest_isw_html() == page("second")
+
+
+def test_latest_report_follows_a_client_swap(isw_db):
+    assert last_isw.get_latest_isw_date() == datetime(2025, 3, 2)
+
+    swapped = mongomock.MongoClient()
+    swapped[mongo.MONGO_DATABASE]["isw_html"].insert_one({"date": datetime(2025, 3, 5), "url": "c", "html_content": ""})
+    mongo.set_client(swapped)
+
+    assert last_isw.get_latest_isw_date() == datetime(2025, 3, 5)
+
+
+def test_features_are_recomputed_only_for_a_new_report(isw_db, monkeypatch):
+    vectorized = []
+
+    def vectorize(text, features=None):
+        vectorized.append(text)
+        return pd.DataFrame([[len(vectorized)]], columns=["count"])
+
+    monkeypatch.setattr(last_isw.isw_data_scraper, "main", lambda argv=None: None)
+    monkeypatch.setattr(last_isw, "get_stop_words", lambda: frozenset())
+    monkeypatch.setattr(last_isw, "lemmatize", lambda word: word)
+    monkeypatch.setattr(last_isw.registry, "get", lambda path: "vectorizer")
+    monkeypatch.setattr(last_isw, "vectorize_isw_features", vectorize)
+
+    first = last_isw.main()
+    assert last_isw.main() is first
+    assert len(vectorized) == 1
+
+    isw_db.insert_one({"date": datetime(2025, 3, 3), "url": "c", "html_content": page("third")})
+    assert last_isw.main()["count"][0] == 2
+    assert vectorized == ["second", "third"]
+
+
+def test_select_features_keeps_only_model_columns():
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    vectorizer = TfidfVectorizer().fit(["russian forces advance", "ukrainian forces repel"])
+    matrix = vectorizer.transform(["russian forces advance"])
+
+    selected = last_isw.select_features(matrix, vectorizer, ["temp", "forces", "advance", "region"])
+    full = last_isw.select_features(matrix, vectorizer)
+
+    assert list(selected.columns) == ["forces", "advance"]
+    assert selected.iloc[0].tolist() == full[["forces", "advance"]].iloc[0].tolist()
+    assert len(full.columns) == len(vectorizer.vocabulary_)
+
+
+REPORT_TEXT = (
+    "Russian forces cannot advance near Pokrovsk on March 2, 2025, and Ukrainian forces repelled "
+    "12 ground attacks.[3] Russian milbloggers claimed that they're gonna seize the village - "
+    "ISW has not observed confirmation of these claims. Kursk Oblast: Russian forces continued "
+    "offensive operations; the Russian MoD claimed advances near Velyka Novosilka. Zaporizhia Oblast"
+)
+
+
+def reference_clean_text(text):
+    import re
+
+    text = re.sub(r"[^a-zA-Z\s]", " ", text)
+    text = text.lower()
+    text = re.sub(r"\d+", "", text)
+    text = re.sub(r"\b\w{1,2}\b", "", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text
+
+
+def reference_preprocess_text(text, stop_words, months):
+    from nltk.stem import WordNetLemmatizer
+    from nltk.tokenize import word_tokenize
+
+    tokens = word_tokenize(text)
+    tokens = [t for t in tokens if t not in stop_words and t not in months]
+    lemmatizer = WordNetLemmatizer()
+    return " ".join(lemmatizer.lemmatize(word) for word in tokens)
+
+
+def test_clean_text_matches_reference():
+    for text in (REPORT_TEXT, "", "  A1 b2 ab abc\t\nİstanbul 'tis  x-ray   ok"):
+        assert last_isw.clean_text(text) == reference_clean_text(text)
+
+
+def test_normalizer_matches_reference_pipeline():
+    import nltk
+
+    try:
+        for resource in ("tokenizers/punkt_tab", "corpora/stopwords", "corpora/wordnet"):
+            nltk.data.find(resource)
+    except LookupError:
+        pytest.skip("NLTK corpora are not installed")
+
+    stop_words = set(last_isw.stopwords.words("english"))
+    expected = reference_preprocess_text(reference_clean_text(REPORT_TEXT), stop_words, last_isw.MONTHS)
+    normalizer = last_isw.TextNormalizer(stop_words)
+
+    assert normalizer.normalize(REPORT_TEXT) == expected
+    assert normalizer.normalize_many([REPORT_TEXT, ""]) == [expected, ""]
@@ -0,0 +1,168 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+os.environ.setdefault("API_TOKEN", "test_token")
+os.environ.setdefault("VISUAL_CROSSING_API_KEY", "test_key")
+
+import main
+
+
+def test_preprocess_data_broadcasts_isw_row():
+    weather = pd.DataFrame({
+        "datetime": ["2025-03-01T10:00:00", "2025-03-01T11:00:00", "2025-03-01T12:00:00", "2025-03-01T13:00:00"],
+        "region": ["Київ", "Київ", "Львівська", "Львівська"],
+        "hour_temp": [1.0, 2.0, 3.0, 4.0],
+        "hour_preciptype": [["rain"], ["rain", "snow"], None, "['freezingrain', 'ice']"],
+    })
+    isw = pd.DataFrame([[0.1, 0.0, 0.7]], columns=["air defense", "attack near", "kursk oblast"])
+
+    result = main.preprocess_data(weather, isw)
+
+    assert list(result.columns) == list(weather.columns) + list(isw.columns)
+    assert result["hour_preciptype"].tolist() == ["rain", "rain snow", "none", "freezingrain ice"]
+    assert pd.api.types.is_datetime64_any_dtype(result["datetime"])
+    np.testing.assert_array_equal(result[isw.columns].to_numpy(), np.repeat(isw.to_numpy(), 4, axis=0))
+
+
+def test_save_predictions_replaces_regions_in_one_bulk_write():
+    from unittest import mock
+    import pymongo
+
+    collection = mock.Mock()
+    results = pd.DataFrame({
+        "datetime": pd.to_datetime(["2025-03-01T11:00:00", "2025-03-01T10:00:00", "2025-03-01T10:00:00"]),
+        "region": ["Київ", "Київ", "Львівська"],
+        "predictions": np.array([1, 0, 1]),
+    })
+
+    main.save_predictions(results, collection)
+
+    collection.bulk_write.assert_called_once()
+    operations = collection.bulk_write.call_args.args[0]
+    assert operations == [
+        pymongo.ReplaceOne({"region": "Київ"}, {
+            "region": "Київ",
+            "hourly_predictions": [
+                {"datetime": "2025-03-01T10:00:00", "prediction": 0},
+                {"datetime": "2025-03-01T11:00:00", "prediction": 1},
+            ]
+        }, upsert=True),
+        pymongo.ReplaceOne({"region": "Львівська"}, {
+            "region": "Львівська",
+            "hourly_predictions": [{"datetime": "2025-03-01T10:00:00", "prediction": 1}]
+        }, upsert=True),
+        pymongo.DeleteMany({"region": {"$nin": ["Київ", "Львівська"]}}),
+    ]
+
+
+def test_load_weather_data_returns_typed_columns():
+    import datetime as dt
+    import mongomock
+    from common import mongo
+    from get_data.weather import get_weather
+
+    client = mongomock.MongoClient()
+    mongo.set_client(client)
+    documents = [{
+        "region": region,
+        "collected_at": "2025-03-01T09:30:00+00:00",
+        "hourly_forecast": [
+            {"datetime": f"2025-03-01T{h:02d}:00:00", "hour_temp": h, "hour_preciptype": None,
+             "hour_conditions": "Clear", "region": region}
+            for h in (11, 10)
+        ]
+    } for region in ("Львівська", "Київ")]
+    client[mongo.MONGO_DATABASE][get_weather.WEATHER_COLLECTION].insert_many(get_weather.flatten_weather(documents))
+
+    try:
+        df = main.load_weather_data()
+    finally:
+        mongo.close_clients()
+
+    assert list(df.columns) == list(get_weather.WEATHER_DTYPES)
+    assert df["region"].tolist() == ["Київ", "Київ", "Львівська", "Львівська"]
+    assert df["datetime"].iloc[0] == dt.datetime(2025, 3, 1, 10)
+    assert df["hour_temp"].dtype == np.float64 and df["day_temp"].isna().all()
+
+
+def _results(hours, predictions, fingerprints, region="Київ"):
+    return pd.DataFrame({
+        "datetime": pd.to_datetime([f"2025-03-01T{h:02d}:00:00" for h in hours]),
+        "region": region,
+        "predictions": np.array(predictions),
+        "fingerprint": np.array(fingerprints, dtype=np.int64),
+    })
+
+
+def test_unchanged_rows_reuse_stored_predictions():
+    X = pd.DataFrame({"hour_temp": [1.0, 2.0, 3.0], "attack near": [0.5, 0.5, 0.5]})
+    fingerprints = main.fingerprint_rows(X, "ab" * 32)
+    hours = pd.to_datetime(["2025-03-01T10:00:00", "2025-03-01T11:00:00", "2025-03-01T12:00:00"])
+    doc, = main.build_prediction_documents(pd.DataFrame({
+        "datetime": hours[:2], "region": "Київ", "predictions": [1, 0], "fingerprint": fingerprints[:2]
+    }))
+
+    X.loc[1, "hour_temp"] = 2.5
+    cached = main.match_stored_predictions(["Київ"] * 3, hours, main.fingerprint_rows(X, "ab" * 32), {"Київ": doc})
+
+    np.testing.assert_array_equal(cached, [1.0, np.nan, np.nan])
+    assert not np.array_equal(main.fingerprint_rows(X, "cd" * 32), main.fingerprint_rows(X, "ab" * 32))
+
+
+def test_save_predictions_writes_only_changed_regions():
+    from unittest import mock
+    import pymongo
+
+    stored_df = pd.concat([_results([10, 11, 12], [0, 1, 1], [1, 2, 3]),
+                           _results([10, 11, 12], [0, 0, 0], [4, 5, 6], region="Львівська")])
+    stored = {doc["region"]: doc for doc in main.build_prediction_documents(stored_df)}
+    collection = mock.Mock()
+
+    assert main.save_predictions(stored_df, collection, stored) == 0
+    collection.bulk_write.assert_not_called()
+
+    shifted = pd.concat([_results([11, 12, 13], [1, 1, 0], [2, 3, 7]),
+                         _results([10, 11, 12], [0, 1, 0], [4, 8, 6], region="Львівська")])
+    assert main.save_predictions(shifted, collection, stored) == 2
+
+    push, replace = collection.bulk_write.call_args.args[0]
+    assert push == pymongo.UpdateOne({"region": "Київ"}, {"$push": {
+        "hourly_predictions": {"$each": [{"datetime": "2025-03-01T13:00:00", "prediction": 0}], "$slice": -3},
+        "fingerprints": {"$each": [7], "$slice": -3},
+    }})
+    assert replace == pymongo.ReplaceOne({"region": "Львівська"},
+                                         main.build_prediction_documents(shifted)[1], upsert=True)
+
+
+def test_shifted_window_update_matches_new_document():
+    import mongomock
+
+    collection = mongomock.MongoClient().db.prediction
+    old, = main.build_prediction_documents(_results([10, 11, 12], [0, 1, 1], [1, 2, 3]))
+    new, = main.build_prediction_documents(_results([12, 13, 14], [1, 0, 0], [3, 7, 9]))
+    collection.insert_one(dict(old))
+
+    operation = main.prediction_write(new, old)
+    collection.update_one(operation._filter, operation._doc)
+
+    assert collection.find_one({}, {"_id": 0}) == new
+
+
+def test_compiled_backend_falls_back_to_a_newer_pipeline(tmp_path, monkeypatch):
+    pkl_path, npz_path = tmp_path / "model.pkl", tmp_path / "model.npz"
+    pkl_path.write_bytes(b"pipeline")
+    npz_path.write_bytes(b"forest")
+    os.utime(pkl_path, (1000, 1000))
+    os.utime(npz_path, (2000, 2000))
+    monkeypatch.setattr(main, "MODEL_PATH", str(pkl_path))
+    monkeypatch.setattr(main, "MODEL_BACKEND", "compiled")
+    assert main.active_model_path() == str(npz_path)
+
+    # Retrained without re-exporting: the old forest must not be served
+    os.utime(pkl_path, (3000, 3000))
+    assert main.active_model_path() == str(pkl_path)
+
+    monkeypatch.setattr(main, "MODEL_BACKEND", "sklearn")
+    assert main.active_model_path() == str(pkl_path)
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_analysis import merge_datasets
+
+
+def write_sources(prepared_dir, alarm_hours, hours=None):
+    if hours is None:
+        hours = pd.date_range("2025-01-31 20:00", "2025-02-01 03:00", freq="1h")
+    weather = pd.DataFrame([
+        {"city": city, "datetime": str(hour), "hour_datetimeEpoch": int(hour.timestamp()), "hour_temp": i}
+        for i, hour in enumerate(hours) for city in ("Львів", "Київ")
+    ])
+    weather.to_csv(prepared_dir / "weather_prepared.csv")
+    alarms = pd.DataFrame([
+        {"region_city": region, "all_region": all_region, "start_epoch": start, "end_epoch": start + 3600,
+         "hour_time": hour}
+        for region, hour, all_region, start in alarm_hours
+    ])
+    alarms.to_csv(prepared_dir / "alarms_prepared.csv")
+    isw = pd.DataFrame({"hour_time": [str(h) for h in hours], "air defense": np.linspace(0, 1, len(hours))})
+    isw.to_csv(prepared_dir / "isw_prepared.csv", index=False)
+
+
+ALARMS = [
+    ("Львівська", "2025-01-31 21:00:00", 1, 100),
+    ("Київська", "2025-01-31 22:00:00", 0, 200),
+    ("Львівська", "2025-02-01 02:00:00", 1, 300),
+]
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    prepared = tmp_path / "prepared"
+    prepared.mkdir()
+    return prepared, str(tmp_path / "staging"), str(tmp_path / "final")
+
+
+def test_months_are_joined_like_the_full_merge(dirs):
+    prepared, staging, output = dirs
+    write_sources(prepared, ALARMS)
+
+    assert merge_datasets.build(str(prepared), staging, output, chunk_rows=5) == ["2025-01", "2025-02"]
+    df = merge_datasets.read_final_dataset(output)
+
+    assert len(df) == 16
+    assert df["is_alarm"].sum() == 3
+    assert df.loc[df["alarms_start_epoch"].eq(200) & df["is_alarm"].eq(1), "region"].tolist() == ["Київ"]
+    # The tail of January is back-filled from the first alarm of February
+    assert df["alarms_start_epoch"].iloc[7] == 300
+    assert df["air defense"].is_monotonic_increasing
+    assert "datetime" not in df.columns and not df.isna().any().any()
+
+
+def test_only_changed_months_are_rebuilt(dirs):
+    prepared, staging, output = dirs
+    write_sources(prepared, ALARMS)
+    merge_datasets.build(str(prepared), staging, output)
+
+    assert merge_datasets.build(str(prepared), staging, output) == []
+
+    write_sources(prepared, ALARMS[:2] + [("Львівська", "2025-02-01 03:00:00", 1, 400)])
+    assert merge_datasets.build(str(prepared), staging, output) == ["2025-01", "2025-02"]
+
+    write_sources(prepared, ALARMS[:2] + [("Львівська", "2025-02-01 03:00:00", 1, 400)])
+    assert merge_datasets.build(str(prepared), staging, output) == []
+
+
+@pytest.mark.filterwarnings("error::FutureWarning")
+def test_months_without_alarms_are_rebuilt_back_to_the_last_alarm(dirs):
+    prepared, staging, output = dirs
+    hours = pd.date_range("2024-12-31 16:00", "2025-02-01 04:00", freq="6h")
+    alarms = [("Львівська", "2024-12-31 16:00:00", 1, 100), ("Львівська", "2025-02-01 04:00:00", 1, 300)]
+    write_sources(prepared, alarms, hours)
+    merge_datasets.build(str(prepared), staging, output)
+
+    write_sources(prepared, alarms[:1] + [("Львівська", "2025-02-01 04:00:00", 1, 400)], hours)
+    # January has no alarms, the end of December is back-filled from February as well
+    assert merge_datasets.build(str(prepared), staging, output) == ["2024-12", "2025-01", "2025-02"]
+    df = merge_datasets.read_final_dataset(output, ["2024-12"])
+    assert df["alarms_start_epoch"].tolist() == [100, 100, 400, 400]
+
+
+@pytest.mark.filterwarnings("error::FutureWarning")
+def test_overlapping_alarms_give_one_row_each(dirs):
+    prepared, staging, output = dirs
+    write_sources(prepared, ALARMS + [("Київська", "2025-01-31 22:00:00", 1, 250)])
+
+    merge_datasets.build(str(prepared), staging, output)
+    df = merge_datasets.read_final_dataset(output)
+
+    # Like the notebook: the hour has a "Київ" row for the city alarm and a "Київська" row for the region alarm
+    assert len(df) == 17
+    hour = df[df["alarms_start_epoch"].isin([200, 250]) & df["is_alarm"].eq(1)]
+    assert hour[["region", "alarms_start_epoch"]].values.tolist() == [["Київ", 200], ["Київська", 250]]
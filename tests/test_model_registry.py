@@ -0,0 +1,58 @@
+import os
+import pickle
+
+from common.model_registry import ModelRegistry
+
+
+def write_artifact(path, obj, mtime):
+    with open(path, "wb") as f:
+        pickle.dump(obj, f)
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_artifact_is_loaded_once(tmp_path):
+    path = tmp_path / "model.pkl"
+    write_artifact(path, {"version": 1}, 1_000_000_000)
+    registry = ModelRegistry()
+
+    assert registry.get(str(path)) is registry.get(str(path))
+
+
+def test_touched_but_identical_artifact_is_not_reloaded(tmp_path):
+    path = tmp_path / "model.pkl"
+    write_artifact(path, {"version": 1}, 1_000_000_000)
+    registry = ModelRegistry()
+    first = registry.get(str(path))
+
+    write_artifact(path, {"version": 1}, 2_000_000_000)
+
+    assert registry.get(str(path)) is first
+
+
+def test_new_artifact_is_hot_swapped(tmp_path):
+    path = tmp_path / "model.pkl"
+    write_artifact(path, {"version": 1}, 1_000_000_000)
+    registry = ModelRegistry()
+    registry.get(str(path))
+
+    write_artifact(path, {"version": 2}, 2_000_000_000)
+
+    assert registry.get(str(path)) == {"version": 2}
+
+
+def test_derived_value_is_rebuilt_after_reload(tmp_path):
+    path = tmp_path / "model.pkl"
+    write_artifact(path, {"version": 1}, 1_000_000_000)
+    registry = ModelRegistry()
+    builds = []
+
+    def build(model):
+        builds.append(model)
+        return model["version"]
+
+    assert registry.derived(str(path), "version", build) == 1
+    assert registry.derived(str(path), "version", build) == 1
+    write_artifact(path, {"version": 2}, 2_000_000_000)
+
+    assert registry.derived(str(path), "version", build) == 2
+    assert len(builds) == 2
@@ -0,0 +1,23 @@
+import mongomock
+from common import mongo
+
+
+def test_get_client_is_shared_per_uri():
+    uri = "mongodb://shared-pool-test:27017"
+    client = mongo.get_client(uri)
+
+    assert mongo.get_client(uri) is client
+    assert mongo.get_client("mongodb://other-pool-test:27017") is not client
+    assert client.options.pool_options.max_pool_size == mongo.MONGO_MAX_POOL_SIZE
+
+
+def test_set_client_overrides_shared_client():
+    uri = "mongodb://injected-test:27017"
+    fake = mongomock.MongoClient()
+    mongo.set_client(fake, uri)
+
+    collection = mongo.get_collection("prediction", uri=uri)
+    collection.insert_one({"region": "Київ"})
+
+    assert mongo.get_client(uri) is fake
+    assert fake[mongo.MONGO_DATABASE]["prediction"].count_documents({}) == 1
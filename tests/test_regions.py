@@ -0,0 +1,25 @@
+import pytest
+
+from common import regions
+
+
+def test_lookups_agree_in_every_direction():
+    lviv = regions.BY_NAME["Львівська"]
+
+    assert regions.BY_CITY_EN["Lviv"] is lviv
+    assert regions.BY_ALT_NAME["Львівщина"] is lviv
+    assert regions.BY_ID[13] is lviv
+    assert lviv.center_city_ua == "Львів"
+    assert len(regions.REGIONS) == 25
+
+
+def test_predicted_regions_exclude_occupied_ones():
+    names = {region.name for region in regions.PREDICTED_REGIONS}
+
+    assert "АР Крим" not in names and "Луганська" not in names
+    assert len(names) == 23
+
+
+def test_unknown_center_raises_key_error():
+    with pytest.raises(KeyError):
+        regions.region_by_city_en("Atlantis")
@@ -15,3 +15,42 @@ def test_alarms_endpoint(client):
     response = client.get('/alarms')
     assert response.status_code == 200
     assert response.get_json() is not None
+
+
+@pytest.fixture
+def prediction_db(monkeypatch):
+    import mongomock
+    import server
+    from common import mongo
+    from common.prediction_cache import PredictionCache
+
+    fake = mongomock.MongoClient()
+    mongo.set_client(fake)
+    # Re-read the generation on every request, as another process would after its check interval
+    monkeypatch.setattr(server, "prediction_cache", PredictionCache(check_interval=0))
+    db = fake[mongo.MONGO_DATABASE]
+    db["prediction"].insert_one({
+        "region": "Київ",
+        "hourly_predictions": [{"datetime": "2025-03-01T12:00:00", "prediction": 1}]
+    })
+    yield db
+    mongo.close_clients()
+
+
+def test_predict_is_served_from_cache_until_new_batch(client, prediction_db):
+    import server
+    from common.prediction_cache import bump_generation
+
+    payload = {"region": "Київ", "token": server.API_TOKEN}
+    first = client.post('/predict', json=payload)
+    assert first.status_code == 200
+    assert first.get_json()["Київ"][0]["prediction"] == 1
+
+    prediction_db["prediction"].update_one(
+        {"region": "Київ"}, {"$set": {"hourly_predictions.0.prediction": 0}}
+    )
+    assert client.post('/predict', json=payload).get_data() == first.get_data()
+
+    # The generation bump alone, as written by main.py in another process, drops the stale entry
+    bump_generation()
+    assert client.post('/predict', json=payload).get_json()["Київ"][0]["prediction"] == 0
@@ -0,0 +1,209 @@
+import asyncio
+from unittest import mock
+
+import tg
+from common.rate_limiter import AsyncRateLimiter
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text))
+
+
+def test_rate_limiter_spaces_calls():
+    limiter = AsyncRateLimiter(rate=50, max_concurrency=2)
+    started = []
+
+    async def call():
+        async with limiter:
+            started.append(asyncio.get_running_loop().time())
+
+    async def run():
+        await asyncio.gather(*(call() for _ in range(6)))
+
+    asyncio.run(run())
+    gaps = [b - a for a, b in zip(started, started[1:])]
+    assert min(gaps) >= 0.015
+
+
+def test_daily_predictions_fetch_each_region_once(monkeypatch):
+    users = [{"user_id": 1, "region": "Київ"}, {"user_id": 2, "region": "Київ"}, {"user_id": 3, "region": "Львівська"}]
+    collection = mock.Mock()
+    collection.find.return_value = users
+    requested = []
+
+    async def get_prediction(region):
+        requested.append(region)
+        return f"forecast {region}"
+
+    monkeypatch.setattr(tg, "users_collection", collection)
+    monkeypatch.setattr(tg, "get_prediction", get_prediction)
+    monkeypatch.setattr(tg, "send_limiter", AsyncRateLimiter(rate=1000))
+    app = mock.Mock(bot=FakeBot())
+
+    asyncio.run(tg.send_daily_predictions(app))
+
+    assert sorted(requested) == ["Київ", "Львівська"]
+    assert sorted(app.bot.sent) == [
+        (1, "Daily Prediction for Київ:\n\nforecast Київ"),
+        (2, "Daily Prediction for Київ:\n\nforecast Київ"),
+        (3, "Daily Prediction for Львівська:\n\nforecast Львівська"),
+    ]
+
+
+def test_daily_predictions_survive_a_failed_region(monkeypatch):
+    users = [{"user_id": 1, "region": "Київ"}, {"user_id": 2, "region": "Львівська"}]
+    collection = mock.Mock()
+    collection.find.return_value = users
+
+    async def get_prediction(region):
+        if region == "Київ":
+            raise tg.httpx.ConnectTimeout("timed out")
+        return f"forecast {region}"
+
+    monkeypatch.setattr(tg, "users_collection", collection)
+    monkeypatch.setattr(tg, "get_prediction", get_prediction)
+    monkeypatch.setattr(tg, "send_limiter", AsyncRateLimiter(rate=1000))
+    app = mock.Mock(bot=FakeBot())
+
+    asyncio.run(tg.send_daily_predictions(app))
+
+    assert sorted(app.bot.sent) == [
+        (1, f"Daily Prediction for Київ:\n\n{tg.PREDICTION_ERROR}"),
+        (2, "Daily Prediction for Львівська:\n\nforecast Львівська"),
+    ]
+
+
+def test_start_registers_a_user_once(monkeypatch):
+    import mongomock
+
+    collection = mongomock.MongoClient()["db"]["users"]
+
+    async def get_location():
+        return "Київ"
+
+    async def get_alarms():
+        return ["Київ"]
+
+    monkeypatch.setattr(tg, "users_collection", collection)
+    monkeypatch.setattr(tg, "get_location", get_location)
+    monkeypatch.setattr(tg, "get_alarms", get_alarms)
+    update = mock.Mock()
+    update.message.from_user.id = 7
+    update.message.from_user.username = "user"
+    update.message.reply_text = mock.AsyncMock()
+
+    asyncio.run(tg.start(update, None))
+    asyncio.run(tg.start(update, None))
+
+    assert collection.count_documents({"user_id": 7, "region": "Київ", "active_alert": True}) == 1
+    assert update.message.reply_text.await_args.args == ("You are already registered.",)
+
+
+def test_only_flipped_regions_are_updated(monkeypatch):
+    import mongomock
+
+    collection = mongomock.MongoClient()["db"]["users"]
+    collection.insert_many([
+        {"user_id": 1, "region": "Київ", "active_alert": False},
+        {"user_id": 2, "region": "Київ", "active_alert": False},
+        {"user_id": 3, "region": "Львівська", "active_alert": True},
+        {"user_id": 4, "region": "Одеська", "active_alert": False},
+    ])
+    alarms = [["Київ"]]
+
+    async def get_alarms():
+        return alarms[0]
+
+    monkeypatch.setattr(tg, "users_collection", collection)
+    monkeypatch.setattr(tg, "get_alarms", get_alarms)
+    monkeypatch.setattr(tg, "send_limiter", AsyncRateLimiter(rate=1000))
+    monkeypatch.setattr(tg, "_previous_alarms", None)
+    app = mock.Mock(bot=FakeBot())
+
+    asyncio.run(tg.check_and_update_alarms(app))
+    assert sorted(chat_id for chat_id, _ in app.bot.sent) == [1, 2, 3]
+    assert sorted(u["user_id"] for u in collection.find({"active_alert": True})) == [1, 2]
+
+    spy = mock.Mock(wraps=collection)
+    monkeypatch.setattr(tg, "users_collection", spy)
+    asyncio.run(tg.check_and_update_alarms(app))
+    assert not spy.method_calls
+
+    alarms[0] = ["Одеська"]
+    asyncio.run(tg.check_and_update_alarms(app))
+    assert sorted(u["user_id"] for u in collection.find({"active_alert": True})) == [4]
+    assert [call for call in spy.method_calls if call[0] == "update_many"] == [
+        mock.call.update_many({"user_id": {"$in": [4]}}, {"$set": {"active_alert": True}}),
+        mock.call.update_many({"user_id": {"$in": [1, 2]}}, {"$set": {"active_alert": False}}),
+    ]
+
+
+def test_undelivered_alarms_leave_the_state_unchanged(monkeypatch):
+    import mongomock
+
+    collection = mongomock.MongoClient()["db"]["users"]
+    collection.insert_many([
+        {"user_id": 1, "region": "Київ", "active_alert": False},
+        {"user_id": 2, "region": "Київ", "active_alert": False},
+    ])
+
+    class BlockedBot(FakeBot):
+        async def send_message(self, chat_id, text):
+            if chat_id == 2:
+                raise tg.Forbidden("bot was blocked by the user")
+            await super().send_message(chat_id, text)
+
+    async def get_alarms():
+        return ["Київ"]
+
+    monkeypatch.setattr(tg, "users_collection", collection)
+    monkeypatch.setattr(tg, "get_alarms", get_alarms)
+    monkeypatch.setattr(tg, "send_limiter", AsyncRateLimiter(rate=1000))
+    monkeypatch.setattr(tg, "_previous_alarms", None)
+
+    asyncio.run(tg.check_and_update_alarms(mock.Mock(bot=BlockedBot())))
+
+    assert sorted(u["user_id"] for u in collection.find({"active_alert": True})) == [1]
+
+
+def test_undelivered_alarm_is_retried_at_the_next_check(monkeypatch):
+    import mongomock
+
+    collection = mongomock.MongoClient()["db"]["users"]
+    collection.insert_many([
+        {"user_id": 1, "region": "Київ", "active_alert": False},
+        {"user_id": 2, "region": "Київ", "active_alert": False},
+        {"user_id": 3, "region": "Одеська", "active_alert": True},
+    ])
+
+    class FlakyBot(FakeBot):
+        failures = 1
+
+        async def send_message(self, chat_id, text):
+            if chat_id == 2 and self.failures:
+                self.failures -= 1
+                raise tg.TelegramError("timed out")
+            await super().send_message(chat_id, text)
+
+    async def get_alarms():
+        return ["Київ"]
+
+    monkeypatch.setattr(tg, "users_collection", collection)
+    monkeypatch.setattr(tg, "get_alarms", get_alarms)
+    monkeypatch.setattr(tg, "send_limiter", AsyncRateLimiter(rate=1000))
+    monkeypatch.setattr(tg, "_previous_alarms", {"Одеська"})
+    bot = FlakyBot()
+
+    asyncio.run(tg.check_and_update_alarms(mock.Mock(bot=bot)))
+    assert sorted(chat_id for chat_id, _ in bot.sent) == [1, 3]
+    assert sorted(u["user_id"] for u in collection.find({"active_alert": True})) == [1]
+
+    asyncio.run(tg.check_and_update_alarms(mock.Mock(bot=bot)))
+    # Only the user who missed the alert gets it, the others are not notified twice
+    assert sorted(chat_id for chat_id, _ in bot.sent) == [1, 2, 3]
+    assert sorted(u["user_id"] for u in collection.find({"active_alert": True})) == [1, 2]
+    assert tg._previous_alarms == {"Київ"}
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from train_models import train
+
+
+def make_dataset(rows=240, seed=0):
+    rng = np.random.default_rng(seed)
+    temp = rng.normal(size=rows)
+    return pd.DataFrame({
+        "hour_datetimeEpoch": np.arange(rows) * 3600,
+        "hour_temp": temp,
+        "hour_windspeed": rng.normal(size=rows),
+        "hour_conditions": rng.choice(["Clear", "Rain"], size=rows),
+        "region": rng.choice(["Київ", "Львівська"], size=rows),
+        "hour_preciptype": rng.choice(["none", "rain"], size=rows),
+        "alarms_start_epoch": 0,
+        "alarms_end_epoch": 0,
+        "is_alarm": (temp + rng.normal(scale=0.3, size=rows) > 0.5).astype(int),
+    })
+
+
+def test_dataset_is_cached_until_csv_changes(tmp_path, monkeypatch):
+    csv_path = tmp_path / "final_dataset.csv"
+    make_dataset().to_csv(csv_path, index=False)
+    first = train.load_dataset(str(csv_path), str(tmp_path / "cache"))
+
+    reads = []
+    monkeypatch.setattr(train.pd, "read_csv", lambda *a, **k: reads.append(a) or first)
+    cached = train.load_dataset(str(csv_path), str(tmp_path / "cache"))
+
+    assert reads == []
+    pd.testing.assert_frame_equal(cached, first)
+
+
+def test_train_tunes_and_saves_the_final_model(tmp_path, monkeypatch):
+    monkeypatch.setattr(train, "PARAM_GRID", {"model__n_estimators": [5, 10]})
+    X, y = train.prepare_training_data(make_dataset())
+
+    pipes, scores, grid_search = train.train(X, y, n_jobs=1)
+    paths = train.save_models(pipes, str(tmp_path))
+
+    assert set(scores) == set(train.MODELS)
+    assert grid_search.best_params_["model__n_estimators"] in (5, 10)
+    assert "hour_datetimeEpoch" not in X.columns and y.value_counts().nunique() == 1
+    model = train.joblib.load(tmp_path / "RandomForestClassifier_model.pkl")
+    assert model.memory is None
+    assert list(model.feature_names_in_) == list(X.columns)
+    assert len(paths) == 4
+    compiled = train.CompiledForest.load(str(tmp_path / "RandomForestClassifier_model.npz"))
+    np.testing.assert_array_equal(compiled.predict(X), model.predict(X))
@@ -0,0 +1,85 @@
+import datetime as dt
+import os
+
+import mongomock
+import pandas as pd
+import pytest
+
+os.environ.setdefault("API_TOKEN", "test_token")
+os.environ.setdefault("VISUAL_CROSSING_API_KEY", "test_key")
+
+from get_data.weather.weather_archive import WeatherArchive
+
+
+def run(collected_at, temps, region="Львівська"):
+    return {
+        "region": region,
+        "collected_at": collected_at,
+        "hourly_forecast": [
+            {"datetime": f"2025-03-01T{h:02d}:00:00", "hour_temp": t, "region": region}
+            for h, t in temps.items()
+        ]
+    }
+
+
+@pytest.fixture
+def archive():
+    return WeatherArchive(mongomock.MongoClient()["db"]["weather_archive"], retention_days=0)
+
+
+def test_runs_are_appended_not_overwritten(archive):
+    assert archive.append([run("2025-03-01T08:00:00+00:00", {10: 1.0, 11: 2.0})]) == 2
+    assert archive.append([run("2025-03-01T09:00:00+00:00", {10: 3.0, 11: 4.0})]) == 2
+    assert archive.append([run("2025-03-01T09:00:00+00:00", {10: 3.0, 11: 4.0})]) == 0
+
+    assert archive.collection.count_documents({}) == 4
+    assert "collected_at_ttl" not in archive.collection.index_information()
+
+
+def test_retention_creates_ttl_index():
+    archive = WeatherArchive(mongomock.MongoClient()["db"]["weather_archive"], retention_days=30)
+    archive.ensure_indexes()
+
+    ttl = archive.collection.index_information()["collected_at_ttl"]
+    assert ttl["expireAfterSeconds"] == 30 * 24 * 3600
+
+
+def test_query_filters_by_target_hour_region_and_collection_time(archive):
+    archive.append([
+        run("2025-03-01T08:00:00+00:00", {10: 1.0, 11: 2.0, 12: 5.0}),
+        run("2025-03-01T08:00:00+00:00", {10: 7.0}, region="Київ"),
+        run("2025-03-01T09:00:00+00:00", {10: 3.0, 11: 4.0}),
+    ])
+
+    df = archive.query(dt.datetime(2025, 3, 1, 10), dt.datetime(2025, 3, 1, 12), regions=["Львівська"])
+    assert df["hour_temp"].tolist() == [1.0, 3.0, 2.0, 4.0]
+    assert str(df["collected_at"].dtype) == "datetime64[ns]"
+
+    latest = archive.query(dt.datetime(2025, 3, 1, 10), dt.datetime(2025, 3, 1, 12), latest_only=True)
+    assert latest[["region", "hour_temp"]].values.tolist() == [["Київ", 7.0], ["Львівська", 3.0], ["Львівська", 4.0]]
+
+    early = archive.query(dt.datetime(2025, 3, 1), dt.datetime(2025, 3, 2), collected_to=dt.datetime(2025, 3, 1, 9))
+    assert sorted(early["hour_temp"].tolist()) == [1.0, 2.0, 5.0, 7.0]
+
+
+def test_export_without_pyarrow_explains_the_missing_dependency(archive, tmp_path, monkeypatch):
+    import sys
+
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    with pytest.raises(RuntimeError, match="pip install pyarrow"):
+        archive.export_parquet(str(tmp_path / "archive.parquet"), dt.datetime(2025, 3, 1), dt.datetime(2025, 3, 2))
+
+
+def test_export_writes_every_chunk(archive, tmp_path):
+    pytest.importorskip("pyarrow")
+    archive.append([
+        run("2025-03-01T08:00:00+00:00", {10: 1.0, 11: 2.0}),
+        run("2025-03-01T09:00:00+00:00", {10: 3.0}),
+    ])
+    path = tmp_path / "archive.parquet"
+
+    exported = archive.export_parquet(str(path), dt.datetime(2025, 2, 27), dt.datetime(2025, 3, 2), chunk_days=1)
+
+    df = pd.read_parquet(path)
+    assert exported == len(df) == 3
+    assert df["hour_temp"].tolist() == [1.0, 3.0, 2.0]
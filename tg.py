@@ -1,35 +1,59 @@
 from telegram.ext import Application, ContextTypes, CommandHandler, ConversationHandler, filters, CallbackQueryHandler, \
     MessageHandler
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import Forbidden, RetryAfter, TelegramError
 import os
 from dotenv import load_dotenv
-import pymongo
-import requests
+import httpx
 import asyncio
-import pandas as pd
+import pymongo
+from collections import defaultdict
 from datetime import datetime
 from apscheduler.schedulers.background import BackgroundScheduler
+from common.mongo import get_database
+from common.rate_limiter import AsyncRateLimiter
+from common.regions import PREDICTED_REGIONS
 
 load_dotenv()
 
 BOT_TOKEN = os.getenv("TG_BOT_TOKEN")
 API_TOKEN = os.getenv("API_TOKEN")
 FLASK_API_URL = os.getenv("FLASK_API_URL")
-client = pymongo.MongoClient("mongodb://localhost:27017")
-db = client["PythonForDs"]
+# Telegram allows about 30 messages per second across all chats
+TG_MESSAGES_PER_SECOND = float(os.getenv("TG_MESSAGES_PER_SECOND", "25"))
+TG_MAX_CONCURRENT_SENDS = int(os.getenv("TG_MAX_CONCURRENT_SENDS", "10"))
+HTTP_TIMEOUT = float(os.getenv("TG_HTTP_TIMEOUT", "10"))
+db = get_database()
 users_collection = db["users"]
 predict_collection = db["prediction"]
-REGIONS = ['Vinnytsia', 'Lutsk', 'Dnipro', 'Donetsk',
-           'Zhytomyr', 'Uzhgorod', 'Zaporozhye', 'Ivano-Frankivsk', 'Kyiv',
-           'Kropyvnytskyi', 'Lviv', 'Mykolaiv', 'Odesa', 'Poltava',
-           'Rivne', 'Sumy', 'Ternopil', 'Kharkiv', 'Kherson', 'Khmelnytskyi',
-           'Cherkasy', 'Chernivtsi', 'Chernihiv', 'Kyivska']
-regions = pd.read_csv("data/regions.csv")
+# Button labels mapped to the region names used by the API; "Kyiv" is the city, "Kyivska" the region around it
+PREDICT_REGIONS = {
+    **{region.center_city_en: region.name for region in PREDICTED_REGIONS},
+    "Kyiv": "Київ",
+    "Kyivska": "Київська"
+}
+REGIONS = list(PREDICT_REGIONS)
 PREDICT_BUTTON = 0
-
-
-def get_prediction(region):
-    response = requests.post(f"{FLASK_API_URL}/predict", json={"region": region, "token": API_TOKEN})
+PREDICTION_ERROR = "Error: Unable to get prediction."
+send_limiter = AsyncRateLimiter(TG_MESSAGES_PER_SECOND, TG_MAX_CONCURRENT_SENDS)
+_http_client = None
+# Regions with an active alarm at the last check, None until the first check
+_previous_alarms = None
+_alarm_index_created = False
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Returns the bot's shared async HTTP client, so calls to the API reuse pooled connections.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=HTTP_TIMEOUT)
+    return _http_client
+
+
+async def get_prediction(region):
+    response = await get_http_client().post(f"{FLASK_API_URL}/predict", json={"region": region, "token": API_TOKEN})
     if response.status_code == 200:
         data = response.json()
         predictions = data.get(region, [])
@@ -42,18 +66,18 @@ def get_prediction(region):
 
             result.append(f"{formatted_datetime} : {value}")
         return "\n".join(result)
-    return "Error: Unable to get prediction."
+    return PREDICTION_ERROR
 
 
-def get_alarms():
-    response = requests.get(f"{FLASK_API_URL}/alarms")
+async def get_alarms():
+    response = await get_http_client().get(f"{FLASK_API_URL}/alarms")
     if response.status_code == 200:
         return response.json()
     return "Error: Unable to get active alarms."
 
 
-def get_location():
-    response = requests.get(f"{FLASK_API_URL}/location")
+async def get_location():
+    response = await get_http_client().get(f"{FLASK_API_URL}/location")
     if response.status_code == 200:
         return response.text
     return "Error: Unable to get location."
@@ -61,17 +85,22 @@ def get_location():
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.message.from_user.id
-    user_location = get_location()
+    user_location = await get_location()
 
     user_data = {
         "user_id": user_id,
         "user_name": update.message.from_user.username,
         "region": user_location,
-        "active_alert": user_location in get_alarms()
+        "active_alert": user_location in await get_alarms()
     }
 
-    if users_collection.find_one({"user_id": user_id}) is None:
+    def register():
+        if users_collection.find_one({"user_id": user_id}) is not None:
+            return False
         users_collection.insert_one(user_data)
+        return True
+
+    if await asyncio.to_thread(register):
         await update.message.reply_text(
             "Welcome!\n\n"
             "- Type /predict and choose a region to view predictions for the next 24 hours.\n"
@@ -102,52 +131,166 @@ async def show_prediction(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     query = update.callback_query
     await query.answer()
     region = query.data.split("_")[1]
-    if region != "Kyiv" and region != "Kyivska":
-        predict_region = regions.loc[regions["center_city_en"] == region, "region"].values[0]
-    elif region == "Kyiv":
-        predict_region = "Київ"
-    else:
-        predict_region = "Kyivska"
-    prediction = get_prediction(predict_region)
+    predict_region = PREDICT_REGIONS[region]
+    prediction = await get_prediction(predict_region)
     await query.edit_message_text(text=f"Prediction for {region}:\n\n{prediction}")
     return ConversationHandler.END
 
 
 async def alarms(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    active_alarms = get_alarms()
+    active_alarms = await get_alarms()
     formatted_alarms = '\n'.join(active_alarms)
     await update.message.reply_text(f"Active alarms:\n{formatted_alarms}")
     return ConversationHandler.END
 
 
-async def send_daily_predictions(app: Application):
-    users = users_collection.find()
+async def send_message(bot, chat_id, text: str) -> bool:
+    """
+    Sends a message under the shared rate limiter. A flood-control answer from Telegram
+    is waited out and retried once; other errors (e.g. a user who blocked the bot) are logged.
+
+    :return: True if the message was delivered.
+    :rtype: bool
+    """
+    for attempt in range(2):
+        try:
+            async with send_limiter:
+                await bot.send_message(chat_id, text)
+            return True
+        except RetryAfter as e:
+            if attempt:
+                break
+            retry_after = e.retry_after
+            await asyncio.sleep(retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else retry_after)
+        except Forbidden:
+            print(f"User {chat_id} blocked the bot")
+            return False
+        except TelegramError as e:
+            print(f"Failed to send a message to {chat_id}: {e}")
+            return False
+    print(f"Failed to send a message to {chat_id}: flood control")
+    return False
+
+
+async def send_many(bot, messages: list) -> list:
+    """
+    Sends (chat_id, text) messages concurrently within the Telegram rate limits.
+
+    :return: The chat ids of the delivered messages.
+    :rtype: list
+    """
+    results = await asyncio.gather(*(send_message(bot, chat_id, text) for chat_id, text in messages))
+    return [chat_id for (chat_id, _), delivered in zip(messages, results) if delivered]
+
+
+def group_users_by_region(users) -> dict:
+    users_by_region = defaultdict(list)
     for user in users:
-        user_id = user["user_id"]
-        region = user["region"]
+        users_by_region[user["region"]].append(user)
+    return users_by_region
 
-        prediction = get_prediction(region)
-        print(prediction)
 
-        await app.bot.send_message(user_id, f"Daily Prediction for {region}:\n\n{prediction}")
+async def send_daily_predictions(app: Application):
+    users = await asyncio.to_thread(
+        lambda: list(users_collection.find({}, {"_id": 0, "user_id": 1, "region": 1}))
+    )
+    users_by_region = group_users_by_region(users)
+
+    # Every region is requested once, however many users are subscribed to it
+    regions_list = list(users_by_region)
+    predictions = await asyncio.gather(*(get_prediction(region) for region in regions_list), return_exceptions=True)
+    # A region whose request failed gets the error text, the other regions are still sent
+    for i, (region, prediction) in enumerate(zip(regions_list, predictions)):
+        if isinstance(prediction, Exception):
+            print(f"Failed to get the prediction for {region}: {prediction}")
+            predictions[i] = PREDICTION_ERROR
+
+    messages = [
+        (user["user_id"], f"Daily Prediction for {region}:\n\n{prediction}")
+        for region, prediction in zip(regions_list, predictions)
+        for user in users_by_region[region]
+    ]
+    sent = await send_many(app.bot, messages)
+    print(f"Daily predictions sent to {len(sent)}/{len(messages)} users in {len(regions_list)} regions")
+
+
+def alarm_transitions(active_alarms: set, previous_alarms) -> list:
+    """
+    Computes the Mongo filters of the users whose alarm state has to flip.
+    Only regions that changed since the previous check are selected; before the first
+    check every user whose stored state disagrees with the current alarms is selected.
+
+    :param active_alarms: Regions with an active alarm.
+    :type active_alarms: set
+    :param previous_alarms: Regions with an active alarm at the previous check, or None.
+    :type previous_alarms: set
+    :return: A list of (filter, new active_alert value) pairs, empty if nothing changed.
+    :rtype: list
+    """
+    if previous_alarms is None:
+        started = {"region": {"$in": sorted(active_alarms)}, "active_alert": False}
+        finished = {"region": {"$nin": sorted(active_alarms)}, "active_alert": True}
+        return [(started, True), (finished, False)]
+
+    transitions = []
+    if active_alarms - previous_alarms:
+        transitions.append(({"region": {"$in": sorted(active_alarms - previous_alarms)}, "active_alert": False}, True))
+    if previous_alarms - active_alarms:
+        transitions.append(({"region": {"$in": sorted(previous_alarms - active_alarms)}, "active_alert": True}, False))
+    return transitions
 
 
 async def check_and_update_alarms(app: Application):
-    users = users_collection.find()
-    active_alarms = get_alarms()
-
-    for user in users:
-        user_id = user["user_id"]
-        region = user["region"]
-        active_alert = user["active_alert"]
-
-        if not active_alert and region in active_alarms:
-            await app.bot.send_message(user_id, f"ALERT: There is an active alarm in your region ({region})!")
-            users_collection.update_one({"user_id": user_id}, {"$set": {"active_alert": True}})
-
-        elif active_alert and region not in active_alarms:
-            await app.bot.send_message(user_id, f"ALARM FINISHED: The alarm in your region ({region}) has ended.")
-            users_collection.update_one({"user_id": user_id}, {"$set": {"active_alert": False}})
+    global _previous_alarms, _alarm_index_created
+
+    active_alarms = await get_alarms()
+    if isinstance(active_alarms, str):
+        print(active_alarms)
+        return
+    active_alarms = set(active_alarms)
+
+    transitions = alarm_transitions(active_alarms, _previous_alarms)
+    if not transitions:
+        return
+
+    def load_users():
+        if not _alarm_index_created:
+            users_collection.create_index([("region", pymongo.ASCENDING), ("active_alert", pymongo.ASCENDING)])
+        return [
+            list(users_collection.find(query, {"_id": 0, "user_id": 1, "region": 1}))
+            for query, _ in transitions
+        ]
+
+    users_per_transition = await asyncio.to_thread(load_users)
+    _alarm_index_created = True
+
+    messages = []
+    for (_, active_alert), users in zip(transitions, users_per_transition):
+        for user in users:
+            if active_alert:
+                text = f"ALERT: There is an active alarm in your region ({user['region']})!"
+            else:
+                text = f"ALARM FINISHED: The alarm in your region ({user['region']}) has ended."
+            messages.append((user["user_id"], text))
+
+    delivered = set(await send_many(app.bot, messages))
+
+    def update_states():
+        # Only the users that got the notification are flipped, by id rather than by the
+        # query, which could also match users registered while the messages were sent
+        for (_, active_alert), users in zip(transitions, users_per_transition):
+            user_ids = [user["user_id"] for user in users if user["user_id"] in delivered]
+            if user_ids:
+                users_collection.update_many({"user_id": {"$in": user_ids}},
+                                             {"$set": {"active_alert": active_alert}})
+
+    await asyncio.to_thread(update_states)
+    # A region with undelivered users is recorded in its old state, so the next check
+    # diffs it again and retries only the users whose stored state is still stale
+    undelivered = {
+        user["region"] for users in users_per_transition for user in users if user["user_id"] not in delivered
+    }
+    _previous_alarms = active_alarms ^ undelivered
 
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
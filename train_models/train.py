@@ -0,0 +1,295 @@
+"""
+Trains the alarm classifiers from `prepared_data/final_dataset.csv`, the scripted
+counterpart of `final_model.ipynb`.
+The CSV is parsed once and cached as a typed binary file (Parquet when pyarrow is
+installed, a pandas pickle otherwise) that is rebuilt only when the CSV changes.
+Cross-validation and the grid search run in parallel on all cores, and the fitted
+preprocessing of every fold is memoized on disk, so the grid search fits it once per
+fold instead of once per parameter combination.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+import joblib
+import numpy as np
+import pandas as pd
+from imblearn.under_sampling import RandomUnderSampler
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.model_selection import GridSearchCV, TimeSeriesSplit, cross_validate
+from sklearn.naive_bayes import GaussianNB
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+from common.compiled_forest import CompiledForest, compiled_path
+from common.files import has_pyarrow
+from data_analysis.merge_datasets import read_final_dataset
+
+FINAL_DATASET = "prepared_data/final_dataset.csv"
+DATASET_CACHE_DIR = "prepared_data/cache"
+MODELS_DIR = "models"
+VECTORIZER_FILE = "tfidf_vectorizer.pkl"
+FINAL_MODEL = "RandomForestClassifier"
+CAT_ATTRIBS = ["hour_conditions", "region", "hour_preciptype"]
+DROP_COLUMNS = ["alarms_start_epoch", "alarms_end_epoch", "is_alarm"]
+N_SPLITS = 5
+
+MODELS = {
+    "GaussianNB": GaussianNB,
+    "DecisionTreeClassifier": DecisionTreeClassifier,
+    "RandomForestClassifier": RandomForestClassifier
+}
+PARAM_GRID = {
+    "model__n_estimators": [200, 300],
+    "model__max_depth": [20, None],
+    "model__min_samples_split": [5, 10]
+}
+SCORING = ["accuracy", "precision", "recall", "f1"]
+
+
+def load_dataset(csv_path: str = FINAL_DATASET, cache_dir: str = DATASET_CACHE_DIR) -> pd.DataFrame:
+    """
+    Loads the final dataset from its binary cache, parsing the CSV only when the cache
+    is missing or the CSV has changed since the cache was written. A directory is read
+    as the partitioned dataset written by `data_analysis.merge_datasets`.
+
+    :param csv_path: Path to the final dataset CSV or partition directory.
+    :type csv_path: str
+    :param cache_dir: Directory for the cached copy.
+    :type cache_dir: str
+    :return: The final dataset.
+    :rtype: pandas.DataFrame
+    """
+    if os.path.isdir(csv_path):
+        return read_final_dataset(csv_path)
+
+    stat = os.stat(csv_path)
+    stamp = {"source": os.path.abspath(csv_path), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    use_parquet = has_pyarrow()
+    cache_file = os.path.join(cache_dir, f"{name}.{'parquet' if use_parquet else 'pkl'}")
+    stamp_file = os.path.join(cache_dir, f"{name}.json")
+
+    try:
+        with open(stamp_file, encoding="utf-8") as f:
+            cached_stamp = json.load(f)
+        if cached_stamp == stamp and os.path.exists(cache_file):
+            return pd.read_parquet(cache_file) if use_parquet else pd.read_pickle(cache_file)
+    except (OSError, ValueError):
+        pass
+
+    df = pd.read_csv(csv_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    if use_parquet:
+        df.to_parquet(cache_file, index=False)
+    else:
+        df.to_pickle(cache_file)
+    with open(stamp_file, "w", encoding="utf-8") as f:
+        json.dump(stamp, f)
+    return df
+
+
+def prepare_training_data(df: pd.DataFrame, random_state: int = 42):
+    """
+    Balances the classes by undersampling and orders the rows by time for the
+    time-series splits, as in `final_model.ipynb`.
+
+    :return: A tuple of the features and the target.
+    :rtype: tuple
+    """
+    X = df.drop(DROP_COLUMNS, axis=1)
+    y = df["is_alarm"]
+
+    undersample = RandomUnderSampler(sampling_strategy="auto", random_state=random_state)
+    X, y = undersample.fit_resample(X, y)
+
+    order = np.argsort(X["hour_datetimeEpoch"].to_numpy(), kind="stable")
+    X = X.iloc[order].drop("hour_datetimeEpoch", axis=1)
+    y = y.iloc[order]
+    return X, y
+
+
+def pipeline_model(model, num_attribs: list, memory=None) -> Pipeline:
+    """
+    Builds the preprocessing and model pipeline.
+
+    :param model: The estimator class.
+    :param num_attribs: Numeric columns to scale.
+    :type num_attribs: list
+    :param memory: Optional `joblib.Memory` that caches the fitted preprocessing.
+    :return: The unfitted pipeline.
+    :rtype: sklearn.pipeline.Pipeline
+    """
+    num_pipeline = Pipeline([
+        ("std_scaler", StandardScaler()),
+    ])
+
+    full_pipeline = ColumnTransformer([
+        ("num", num_pipeline, num_attribs),
+        ("cat", OneHotEncoder(handle_unknown="ignore"), CAT_ATTRIBS),
+    ])
+    return Pipeline([
+        ("preprocessor", full_pipeline),
+        ("model", model())
+    ], memory=memory)
+
+
+@contextmanager
+def timed(name: str, timings: dict):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - started
+
+
+def fit_vectorizer(collection) -> TfidfVectorizer:
+    """
+    Fits the TF-IDF vectorizer on every processed ISW report with the settings of
+    `isw_analysis.ipynb`, normalizing the texts like `last_isw` does at prediction time.
+
+    :param collection: MongoDB collection with an `extracted_text` field.
+    :return: The fitted vectorizer.
+    """
+    from get_data.isw.last_isw import TextNormalizer
+
+    normalizer = TextNormalizer()
+    texts = normalizer.normalize_many(
+        doc["extracted_text"] for doc in collection.find({}, {"_id": 0, "extracted_text": 1}).sort("date", 1)
+    )
+    vectorizer = TfidfVectorizer(max_features=100, min_df=10, max_df=0.9, ngram_range=(2, 2))
+    return vectorizer.fit(texts)
+
+
+def train(X: pd.DataFrame, y: pd.Series, n_jobs: int = -1, cache_dir: str = None, timings: dict = None):
+    """
+    Cross-validates every model, tunes the final model with a grid search and refits it.
+
+    :param X: The features, ordered by time.
+    :param y: The target.
+    :param n_jobs: Number of parallel jobs, -1 uses all cores.
+    :type n_jobs: int
+    :param cache_dir: Directory for the memoized preprocessing. A temporary one is used when None.
+    :type cache_dir: str
+    :param timings: Dict that receives the wall-clock time of every stage.
+    :type timings: dict
+    :return: A tuple of the fitted pipelines by model name, the mean cross-validation
+        scores by model name and the fitted grid search.
+    :rtype: tuple
+    """
+    timings = {} if timings is None else timings
+    num_attribs = X.select_dtypes(include="number").columns.tolist()
+    tscv = TimeSeriesSplit(n_splits=N_SPLITS)
+    own_cache = cache_dir is None
+    cache_dir = tempfile.mkdtemp(prefix="train_cache_") if own_cache else cache_dir
+    memory = joblib.Memory(cache_dir, verbose=0)
+
+    try:
+        pipes, scores = {}, {}
+        for name, model in MODELS.items():
+            with timed(f"cv {name}", timings):
+                result = cross_validate(pipeline_model(model, num_attribs, memory), X, y, cv=tscv,
+                                        scoring=SCORING, n_jobs=n_jobs)
+                scores[name] = {metric: float(np.mean(result[f"test_{metric}"])) for metric in SCORING}
+            if name != FINAL_MODEL:
+                with timed(f"fit {name}", timings):
+                    pipes[name] = pipeline_model(model, num_attribs).fit(X, y)
+
+        grid_search = GridSearchCV(
+            pipeline_model(MODELS[FINAL_MODEL], num_attribs, memory),
+            PARAM_GRID,
+            cv=tscv,
+            scoring="accuracy",
+            n_jobs=n_jobs
+        )
+        with timed(f"grid search {FINAL_MODEL}", timings):
+            grid_search.fit(X, y)
+        best_model = grid_search.best_estimator_
+        # The memoized transformer lives in the cache directory, detach it before saving
+        best_model.set_params(memory=None)
+        pipes[FINAL_MODEL] = best_model
+        return pipes, scores, grid_search
+    finally:
+        memory.clear(warn=False)
+        if own_cache:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def save_models(pipes: dict, models_dir: str = MODELS_DIR) -> list:
+    """
+    Saves every pipeline as `<name>_model.pkl`, the file names `main.py` loads. The
+    random forest is also exported as `<name>_model.npz` for `MODEL_BACKEND=compiled`,
+    so both backends always serve the same model.
+
+    :return: The written paths.
+    :rtype: list
+    """
+    os.makedirs(models_dir, exist_ok=True)
+    paths = []
+    for name, model in pipes.items():
+        path = os.path.join(models_dir, f"{name}_model.pkl")
+        joblib.dump(model, path)
+        paths.append(path)
+        if isinstance(model.steps[-1][1], RandomForestClassifier):
+            paths.append(CompiledForest.export(model, compiled_path(path)))
+    return paths
+
+
+def format_report(scores: dict, grid_search: GridSearchCV, timings: dict) -> str:
+    lines = []
+    for name, metrics in scores.items():
+        lines.append(f"Model: {name}")
+        lines.extend(f"{metric.capitalize()}: {value:.4f}" for metric, value in metrics.items())
+        lines.append("==============================")
+    lines.append(f"Best parameters: {grid_search.best_params_}")
+    lines.append(f"Best accuracy: {grid_search.best_score_:.4f}")
+    lines.append("Wall-clock time:")
+    lines.extend(f"  {name}: {seconds:.2f}s" for name, seconds in timings.items())
+    lines.append(f"  total: {sum(timings.values()):.2f}s")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the alarm prediction models")
+    parser.add_argument("--dataset", default=FINAL_DATASET, help="Final dataset CSV")
+    parser.add_argument("--cache-dir", default=DATASET_CACHE_DIR, help="Directory for the cached dataset")
+    parser.add_argument("--models-dir", default=MODELS_DIR, help="Output directory for the pickles")
+    parser.add_argument("--jobs", type=int, default=-1, help="Parallel jobs, -1 uses all cores")
+    parser.add_argument("--fit-vectorizer", action="store_true",
+                        help="Also refit the TF-IDF vectorizer on the ISW reports in MongoDB. The final "
+                             "dataset has to be rebuilt with the new vectorizer before the next training")
+    parser.add_argument("--isw-collection", default="isw_report", help="Collection with the processed ISW reports")
+    args = parser.parse_args(argv)
+
+    timings = {}
+    try:
+        if args.fit_vectorizer:
+            from common.mongo import get_collection
+
+            with timed("vectorizer", timings):
+                vectorizer = fit_vectorizer(get_collection(args.isw_collection))
+                os.makedirs(args.models_dir, exist_ok=True)
+                joblib.dump(vectorizer, os.path.join(args.models_dir, VECTORIZER_FILE))
+
+        with timed("load dataset", timings):
+            df = load_dataset(args.dataset, args.cache_dir)
+        with timed("prepare", timings):
+            X, y = prepare_training_data(df)
+
+        pipes, scores, grid_search = train(X, y, n_jobs=args.jobs, timings=timings)
+        with timed("save", timings):
+            paths = save_models(pipes, args.models_dir)
+
+        print(format_report(scores, grid_search, timings))
+        print(f"Saved {', '.join(paths)}")
+    except Exception as e:
+        print(f"Training error: {str(e)}")
+
+
+if __name__ == "__main__":
+    main()